@@ -0,0 +1,611 @@
+"""Performance benchmarks for dress_modifier.
+
+    python benchmark.py fallback --sizes 512 2048 4096 --json fallback.json
+    python benchmark.py --repeat 1 quantized --size 512 --preset final
+    python benchmark.py --repeat 2 onnx --size 512 --preset draft
+    python benchmark.py --repeat 3 presets --size 512
+    python benchmark.py workers --counts 1 2 4 --requests 16
+    python benchmark.py latents --size 512 --preset draft
+    python benchmark.py --repeat 2 variants --count 4 --preset draft
+    python benchmark.py memory --size 512 --batch-size 2
+    python benchmark.py imports --budget 1.0
+    python benchmark.py --json current.json suite --pipeline stub
+    python benchmark.py compare baseline.json current.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.fallback import recolor
+from src.presets import PRESETS, DEFAULT_PRESET
+from src.memory import MEMORY_MODES
+
+
+def legacy_fallback(image, mask, prompt):
+    """The per-channel np.where fallback that recolor() replaced, kept for comparison"""
+    img_np = np.array(image)
+    mask_np = np.array(mask)
+
+    if "red" in prompt.lower():
+        color = [255, 100, 100]
+    elif "blue" in prompt.lower():
+        color = [100, 100, 255]
+    elif "green" in prompt.lower():
+        color = [100, 255, 100]
+    elif "black" in prompt.lower():
+        color = [50, 50, 50]
+    elif "white" in prompt.lower():
+        color = [240, 240, 240]
+    else:
+        color = [200, 150, 200]
+
+    for i in range(3):
+        img_np[:,:,i] = np.where(mask_np > 128,
+                               img_np[:,:,i] * 0.3 + color[i] * 0.7,
+                               img_np[:,:,i])
+
+    return Image.fromarray(img_np.astype(np.uint8))
+
+
+def synthetic_inputs(size, coverage=0.3, seed=0):
+    """A textured RGB photo and an elliptical mask covering roughly `coverage` of it"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    shading = 0.5 + 0.5 * np.sin(x / 23.0) * np.cos(y / 31.0)
+    noise = rng.integers(0, 40, (height, width, 1), dtype=np.uint8)
+    image = (shading[..., None] * np.array([180, 120, 90], dtype=np.float32)).astype(np.uint8) + noise
+
+    # Ellipse area is pi * rx * ry; pick radii proportional to the image for the requested coverage
+    scale = np.sqrt(coverage / np.pi)
+    rx, ry = max(width * scale, 1), max(height * scale, 1)
+    mask = (((x - width / 2) / rx) ** 2 + ((y - height / 2) / ry) ** 2 <= 1).astype(np.uint8) * 255
+    return Image.fromarray(image), Image.fromarray(mask)
+
+
+def editor_value(image, mask):
+    """What gr.ImageMask passes for a photo with mask drawn in white strokes"""
+    layer = Image.new("RGBA", mask.size, (255, 255, 255, 0))
+    layer.putalpha(mask)
+    return {"background": image, "layers": [layer], "composite": image}
+
+
+def time_call(fn, repeat=5, warmup=1):
+    """Median and best wall time of fn() in seconds"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return {"median_s": statistics.median(samples), "best_s": min(samples)}
+
+
+def bench_fallback(args):
+    results = []
+    for size in args.sizes:
+        image, mask = synthetic_inputs((size, size * 3 // 4), args.coverage)
+        legacy = time_call(lambda: legacy_fallback(image, mask, "red dress"), args.repeat)
+        current = time_call(lambda: recolor(image, mask, "red dress"), args.repeat)
+        speedup = legacy["median_s"] / current["median_s"]
+        print(f"{size:>5}px  legacy {legacy['median_s'] * 1000:8.1f} ms  "
+              f"recolor {current['median_s'] * 1000:8.1f} ms  x{speedup:.1f}")
+        results.append({"size": size, "coverage": args.coverage, "legacy": legacy, "recolor": current,
+                        "speedup": speedup})
+    return results
+
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio between two images in dB"""
+    diff = np.asarray(a, dtype=np.float32) - np.asarray(b, dtype=np.float32)
+    mse = float(np.mean(diff ** 2))
+    return float("inf") if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+BENCH_PROMPTS = ["red flowing evening dress", "blue floral summer dress", "elegant black cocktail dress"]
+
+
+def bench_quantized(args):
+    """Latency and output quality of the int8 pipeline against float32 with identical seeds"""
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    variants = {}
+    for name, quantize in (("fp32", False), ("int8", True)):
+        modifier = DressModifier(quantize=quantize)
+        if modifier.pipe is None:
+            raise SystemExit(f"{name} pipeline failed to load")
+        outputs = {}
+        timings = []
+        for prompt in BENCH_PROMPTS:
+            timing = time_call(
+                lambda: outputs.__setitem__(prompt, modifier.modify_dress(image, mask, prompt, seed=0,
+                                                                          preset=args.preset)),
+                args.repeat, warmup=0
+            )
+            timings.append(timing["median_s"])
+        variants[name] = {"load_s": modifier.load_seconds, "median_s": statistics.median(timings), "outputs": outputs}
+        print(f"{name}: load {modifier.load_seconds:.1f} s, median {variants[name]['median_s']:.2f} s per image")
+        modifier.close(unload=True)
+
+    quality = [psnr(variants["fp32"]["outputs"][p], variants["int8"]["outputs"][p]) for p in BENCH_PROMPTS]
+    speedup = variants["fp32"]["median_s"] / variants["int8"]["median_s"]
+    print(f"int8 vs fp32: x{speedup:.2f} faster, PSNR {statistics.mean(quality):.1f} dB (higher is closer)")
+    return {
+        "size": args.size,
+        "preset": args.preset,
+        "fp32": {k: v for k, v in variants["fp32"].items() if k != "outputs"},
+        "int8": {k: v for k, v in variants["int8"].items() if k != "outputs"},
+        "speedup": speedup,
+        "psnr_db": dict(zip(BENCH_PROMPTS, quality)),
+    }
+
+
+def _graph_outputs(modifier, size):
+    """Text embedding and one UNet call on fixed inputs, as float32 arrays, for either backend"""
+    import torch
+
+    embeds = modifier.encode_prompt(BENCH_PROMPTS[0], cache=False)
+    embeds = embeds.cpu().float().numpy() if isinstance(embeds, torch.Tensor) else embeds
+    rng = np.random.RandomState(0)
+    sample = rng.randn(1, 9, size // 8, size // 8).astype(np.float32)
+    timestep = np.array([500.0], dtype=np.float32)
+    if modifier.backend == "onnx":
+        noise = modifier.pipe.unet(sample=sample, timestep=timestep, encoder_hidden_states=embeds)[0]
+    else:
+        unet = modifier.pipe.unet
+        with torch.no_grad():
+            noise = unet(*(torch.from_numpy(a).to(unet.device, unet.dtype) for a in (sample, timestep, embeds)),
+                         return_dict=False)[0].cpu().float().numpy()
+    return {"text_encoder": embeds, "unet": noise}
+
+
+def bench_onnx(args):
+    """Latency of the ONNX Runtime backend against torch, with graph parity on identical inputs.
+
+    End-to-end outputs start from different noise (torch vs numpy generators),
+    so their PSNR measures similarity, not parity; the graph outputs do.
+    """
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    backends = {}
+    for name in ("torch", "onnx"):
+        modifier = DressModifier(backend=name)
+        if modifier.pipe is None:
+            raise SystemExit(f"{name} pipeline failed to load")
+        outputs = {}
+        timings = []
+        for prompt in BENCH_PROMPTS:
+            timing = time_call(
+                lambda: outputs.__setitem__(prompt, modifier.modify_dress(image, mask, prompt, seed=0,
+                                                                          preset=args.preset)),
+                args.repeat, warmup=0
+            )
+            timings.append(timing["median_s"])
+        backends[name] = {"device": modifier.device, "load_s": modifier.load_seconds,
+                          "median_s": statistics.median(timings), "outputs": outputs,
+                          "graphs": _graph_outputs(modifier, args.size)}
+        print(f"{name}: load {modifier.load_seconds:.1f} s, median {backends[name]['median_s']:.2f} s per image")
+        modifier.close(unload=True)
+
+    parity = {graph: float(np.max(np.abs(backends["torch"]["graphs"][graph] - backends["onnx"]["graphs"][graph])))
+              for graph in backends["torch"]["graphs"]}
+    quality = [psnr(backends["torch"]["outputs"][p], backends["onnx"]["outputs"][p]) for p in BENCH_PROMPTS]
+    speedup = backends["torch"]["median_s"] / backends["onnx"]["median_s"]
+    print(f"onnx vs torch: x{speedup:.2f} faster, max abs diff "
+          + ", ".join(f"{graph} {diff:.2e}" for graph, diff in parity.items())
+          + f", output PSNR {statistics.mean(quality):.1f} dB")
+    return {
+        "size": args.size,
+        "preset": args.preset,
+        "torch": {k: v for k, v in backends["torch"].items() if k not in ("outputs", "graphs")},
+        "onnx": {k: v for k, v in backends["onnx"].items() if k not in ("outputs", "graphs")},
+        "speedup": speedup,
+        "max_abs_diff": parity,
+        "psnr_db": dict(zip(BENCH_PROMPTS, quality)),
+    }
+
+
+def bench_presets(args):
+    """Latency of each quality preset on one loaded pipeline, relative to the slowest"""
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    modifier = DressModifier()
+    if modifier.pipe is None:
+        raise SystemExit("Pipeline failed to load")
+    results = {}
+    for name in PRESETS:
+        # One untimed run builds the preset's scheduler before timing
+        timing = time_call(lambda: modifier.modify_dress(image, mask, BENCH_PROMPTS[0], seed=0, preset=name),
+                           args.repeat)
+        results[name] = dict(PRESETS[name], **timing)
+    slowest = max(r["median_s"] for r in results.values())
+    for name, result in results.items():
+        result["relative"] = result["median_s"] / slowest
+        print(f"{name:>8}: {result['scheduler']:>8}, {result['num_inference_steps']:>2} steps, "
+              f"median {result['median_s']:.2f} s ({result['relative']:.0%} of slowest)")
+    modifier.close()
+    return {"size": args.size, "presets": results}
+
+
+def bench_workers(args):
+    """Throughput of the worker pool for each worker count, relative to a single worker"""
+    from src.workers import WorkerPool
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    results = []
+    for count in args.counts:
+        pool = WorkerPool(count, max_batch_size=args.batch_size)
+        pool.wait_until_ready()
+        started = time.perf_counter()
+        futures = [pool.submit(image, mask, BENCH_PROMPTS[i % len(BENCH_PROMPTS)], seed=i, preset=args.preset)
+                   for i in range(args.requests)]
+        for future in futures:
+            future.result()
+        elapsed = time.perf_counter() - started
+        pool.close()
+        results.append({"workers": count, "seconds": elapsed, "images_per_second": args.requests / elapsed})
+    for result in results:
+        result["scaling"] = result["images_per_second"] / results[0]["images_per_second"]
+        print(f"{result['workers']:>3} workers: {result['images_per_second']:.2f} images/s "
+              f"(x{result['scaling']:.2f} vs {results[0]['workers']})")
+    return {"size": args.size, "requests": args.requests, "preset": args.preset, "runs": results}
+
+
+def bench_latents(args):
+    """Per-prompt latency on one photo with and without the VAE latent cache"""
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    results = {}
+    for name, cache_size in (("uncached", 0), ("cached", 64)):
+        modifier = DressModifier(latent_cache_size=cache_size)
+        if modifier.pipe is None:
+            raise SystemExit("Pipeline failed to load")
+        # The first prompt fills the cache; the others are the stylist's follow-up tries
+        modifier.modify_dress(image, mask, BENCH_PROMPTS[0], seed=0, preset=args.preset)
+        timings = [time_call(lambda: modifier.modify_dress(image, mask, prompt, seed=0, preset=args.preset),
+                             args.repeat, warmup=0)["median_s"]
+                   for prompt in BENCH_PROMPTS[1:]]
+        results[name] = {"median_s": statistics.median(timings), "latent_cache": modifier.load_metrics()["latent_cache"]}
+        print(f"{name:>8}: median {results[name]['median_s']:.2f} s per prompt")
+        modifier.close()
+    speedup = results["uncached"]["median_s"] / results["cached"]["median_s"]
+    print(f"latent cache: x{speedup:.2f} per follow-up prompt")
+    return {"size": args.size, "preset": args.preset, "speedup": speedup, **results}
+
+
+def bench_variants(args):
+    """N variants in one batched call against N separate calls with the same seeds"""
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    modifier = DressModifier()
+    if modifier.pipe is None:
+        raise SystemExit("Pipeline failed to load")
+    prompt = BENCH_PROMPTS[0]
+    seeds = list(range(args.count))
+    batched = time_call(lambda: modifier.modify_dress(image, mask, prompt, seed=0, preset=args.preset,
+                                                      num_variants=args.count), args.repeat)
+    separate = time_call(lambda: [modifier.modify_dress(image, mask, prompt, seed=seed, preset=args.preset)
+                                  for seed in seeds], args.repeat)
+    # Variant i from the batch against the same seed run alone (batched kernels may round differently)
+    variants = modifier.modify_dress(image, mask, prompt, seed=0, preset=args.preset, num_variants=args.count)
+    quality = [psnr(variant, modifier.modify_dress(image, mask, prompt, seed=seed, preset=args.preset))
+               for variant, seed in zip(variants, seeds)]
+    speedup = separate["median_s"] / batched["median_s"]
+    print(f"{args.count} variants: batched {batched['median_s']:.2f} s, separate {separate['median_s']:.2f} s "
+          f"(x{speedup:.2f}); batch vs alone PSNR {min(quality):.1f} dB")
+    modifier.close()
+    return {"size": args.size, "count": args.count, "preset": args.preset, "batched": batched,
+            "separate": separate, "speedup": speedup, "psnr_db": quality}
+
+
+def bench_memory(args):
+    """Latency and peak memory of one batch in each memory mode, relative to the first (fastest) one"""
+    from src.memory import MEMORY_MODES, PeakMemory, apply_memory_mode
+    from src.model import DressModifier
+
+    image, mask = synthetic_inputs((args.size, args.size), args.coverage)
+    modifier = DressModifier()
+    if modifier.pipe is None:
+        raise SystemExit("Pipeline failed to load")
+    # Offload cannot be undone, so it runs last (and only on CUDA)
+    modes = [mode for mode in MEMORY_MODES if mode in args.modes and (modifier.device == "cuda" or mode != "offload")]
+    results = {}
+    for mode in modes:
+        apply_memory_mode(modifier.pipe, mode)
+        batch = ([image] * args.batch_size, [mask] * args.batch_size, BENCH_PROMPTS[:1] * args.batch_size,
+                 list(range(args.batch_size)))
+        modifier.modify_dress_batch(*batch, preset=args.preset)
+        with PeakMemory() as peak:
+            timing = time_call(lambda: modifier.modify_dress_batch(*batch, preset=args.preset), args.repeat, warmup=0)
+        results[mode] = dict(timing, **{f"peak_{k}": v for k, v in peak.peak.items()})
+    for mode, result in results.items():
+        result["relative"] = result["median_s"] / results[modes[0]]["median_s"]
+        rss = result["peak_rss_bytes"]
+        rss = f"{rss / 1024 ** 2:.0f} MB" if rss is not None else "n/a (VmHWM cannot be reset here)"
+        cuda = f", peak CUDA {result['peak_cuda_bytes'] / 1024 ** 2:.0f} MB" if "peak_cuda_bytes" in result else ""
+        print(f"{mode:>18}: median {result['median_s']:.2f} s (x{result['relative']:.2f}), peak RSS {rss}{cuda}")
+    modifier.close()
+    return {"size": args.size, "batch_size": args.batch_size, "preset": args.preset, "modes": results}
+
+
+# Imported on first use only; none of them should load when a module below is imported
+HEAVY_MODULES = ("torch", "diffusers", "transformers", "gradio", "fastapi", "cv2", "onnxruntime", "onnx")
+IMPORT_CHECKS = ["src.app", "src.model", "src.batching", "src.workers", "src.metrics", "src.cache"]
+HELP_CHECKS = ["run.py", "commandline.py"]
+
+
+def _top_imports(importtime_log, count=5):
+    """The slowest third-party and stdlib packages in a `python -X importtime` log, as (package, seconds)"""
+    packages = {}
+    for line in importtime_log.splitlines():
+        parts = line.split("|")
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        name = parts[2].strip()
+        # Package roots only (their cumulative time covers submodules); our own modules are the subject
+        if "." not in name and name != "src":
+            packages[name] = max(packages.get(name, 0.0), int(parts[1]) / 1e6)
+    return sorted(packages.items(), key=lambda entry: -entry[1])[:count]
+
+
+def bench_imports(args):
+    """Cold-start time of key modules and of CLI --help in fresh interpreters; exits 1 over --budget"""
+    import subprocess
+    import sys
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    # Prints the heavy modules the import dragged in, if any
+    probe = "import sys, {}; print(','.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+    checks = [("import", module, [sys.executable, "-X", "importtime", "-c", probe.format(module)])
+              for module in IMPORT_CHECKS]
+    checks += [("help", script, [sys.executable, os.path.join(here, script), "--help"]) for script in HELP_CHECKS]
+
+    results = []
+    for kind, name, command in checks:
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            done = subprocess.run(command, cwd=here, capture_output=True, text=True)
+            samples.append(time.perf_counter() - started)
+        heavy = [m for m in done.stdout.strip().split(",") if m] if kind == "import" else []
+        result = {"kind": kind, "name": name, "median_s": statistics.median(samples), "best_s": min(samples),
+                  "heavy_modules": heavy, "slowest_imports": _top_imports(done.stderr) if kind == "import" else [],
+                  "ok": done.returncode == 0}
+        result["over_budget"] = result["median_s"] > args.budget or bool(heavy) or not result["ok"]
+        results.append(result)
+        flag = "  OVER BUDGET" if result["over_budget"] else ""
+        loaded = f", loads {', '.join(heavy)}" if heavy else ""
+        print(f"{kind:>6} {name:<16} {result['median_s'] * 1000:7.0f} ms{loaded}{flag}")
+        for module, seconds in result["slowest_imports"][:3]:
+            print(f"{'':>24}{module:<20} {seconds * 1000:6.0f} ms")
+    failed = [r for r in results if r["over_budget"]]
+    print(f"{len(results)} checks, {len(failed)} over the {args.budget:.2f} s budget or loading heavy modules")
+    if failed:
+        raise SystemExit(1)
+    return {"budget_s": args.budget, "checks": results}
+
+
+def environment():
+    """Versions and hardware, stored with suite results so runs are comparable"""
+    info = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+    for name in ("torch", "diffusers", "numpy", "PIL", "cv2"):
+        try:
+            info[name] = __import__(name).__version__
+        except ImportError:
+            info[name] = None
+    return info
+
+
+def bench_suite(args):
+    """modify_dress_interface, fallback_modify and input preprocessing across sizes and mask coverages.
+
+    Runs against a deterministic stub or a tiny randomly initialised pipeline,
+    so no SD2 weights are downloaded.
+    """
+    from src.app import DressModifierApp
+    from src.registry import registry
+    from src.stub_pipeline import StubInpaintPipeline, tiny_inpaint_pipeline
+    from src.mask import prepare_mask
+    from src.utils import encode_image, load_image, resize_image, mask_to_pil, prepare_crop
+    from src.cpu_profile import bucket_for
+
+    pipe = StubInpaintPipeline(args.step_ms / 1000) if args.pipeline == "stub" else tiny_inpaint_pipeline()
+    registry.register(pipe)
+    # No result cache, so every repeat runs the pipeline
+    app = DressModifierApp(cache_dir=None, cache_items=0, background_load=False, warmup_size=0,
+                           preset=args.preset, max_batch_size=args.batch_size)
+    prompt = BENCH_PROMPTS[0]
+
+    records = []
+
+    def measure(bench, params, fn):
+        with contextlib.redirect_stdout(io.StringIO()):
+            timing = time_call(fn, args.repeat)
+        records.append({"bench": bench, "params": params, **timing})
+        print(f"{bench:>24} {json.dumps(params):<48} median {timing['median_s'] * 1000:9.2f} ms")
+
+    for size in args.sizes:
+        image, mask = synthetic_inputs((size, size * 3 // 4), 0.3)
+        # Gradio's ImageMask hands over the photo and the strokes as a transparent layer
+        mask_data = editor_value(image, mask)
+        jpeg = encode_image(image, "JPEG")
+        measure("resize_image", {"size": size}, lambda: resize_image(image))
+        measure("load_image", {"size": size, "max_size": 512}, lambda: load_image(jpeg, max_size=512))
+        measure("mask_to_pil", {"size": size}, lambda: mask_to_pil(mask_data))
+        measure("prepare_mask", {"size": size}, lambda: prepare_mask(mask_data))
+
+        for coverage in args.coverages:
+            image, mask = synthetic_inputs((size, size * 3 // 4), coverage)
+            mask_data = editor_value(image, mask)
+            params = {"size": size, "coverage": coverage}
+            measure("fallback_modify", params, lambda: app.modifier.fallback_modify(image, mask, prompt))
+            for mode in args.modes:
+                measure("modify_dress_interface", dict(params, mode=mode),
+                        lambda: app.modify_dress_interface(image, mask_data, prompt, mode))
+
+        # Throughput: concurrent requests share batches in the scheduler
+        image, mask = synthetic_inputs((size, size * 3 // 4), 0.3)
+        mask_data = editor_value(image, mask)
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(args.batch_size * 2) as pool:
+            started = time.perf_counter()
+            list(pool.map(lambda i: app.modify_dress_interface(image, mask_data, prompt, "resize", seed=i),
+                          range(args.requests)))
+            elapsed = time.perf_counter() - started
+        records.append({"bench": "throughput", "params": {"size": size, "requests": args.requests},
+                        "images_per_second": args.requests / elapsed})
+        print(f"{'throughput':>24} {size}px: {args.requests / elapsed:.2f} images/s")
+
+    # A wide crop must reach the UNet at its own aspect ratio, not squashed to 512x512 and stretched back
+    image, mask = synthetic_inputs((1200, 600), 0.3)
+    crop_image, crop_mask, _ = prepare_crop(image, mask)
+    buckets = app.modifier.resolution_buckets
+    expected = bucket_for(crop_image.size, buckets) if buckets else crop_image.size
+    rendered = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        app.modifier.modify_dress(crop_image, crop_mask, prompt, seed=0,
+                                  step_callback=lambda step, total, latents: rendered.append(latents.shape))
+    rendered = (rendered[-1][-1] * 8, rendered[-1][-2] * 8) if rendered else None
+    records.append({"bench": "crop_aspect", "params": {"crop": list(crop_image.size)},
+                    "rendered": list(rendered) if rendered else None})
+    print(f"{'crop_aspect':>24} crop {crop_image.size[0]}x{crop_image.size[1]} rendered at {rendered}")
+    if rendered != tuple(expected):
+        app.scheduler.close()
+        raise SystemExit(f"Crop {crop_image.size} was rendered at {rendered}, expected {tuple(expected)}")
+
+    app.scheduler.close()
+    return {"environment": environment(), "pipeline": args.pipeline, "preset": args.preset, "records": records}
+
+
+def bench_compare(args):
+    """Median-time ratios between two suite result files; exits 1 if anything got slower than --threshold"""
+    def load(path):
+        with open(path) as f:
+            results = json.load(f)["results"]
+        return {(r["bench"], json.dumps(r["params"], sort_keys=True)): r for r in results["records"]}
+
+    baseline, current = load(args.baseline), load(args.current)
+    rows = []
+    for key in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[key], current[key]
+        if "median_s" in before:
+            ratio = after["median_s"] / before["median_s"]
+        else:
+            # Throughput: higher is better, so invert to keep ratio > 1 meaning slower
+            ratio = before["images_per_second"] / after["images_per_second"]
+        rows.append({"bench": key[0], "params": json.loads(key[1]), "ratio": ratio,
+                     "regression": ratio > args.threshold})
+        flag = "  REGRESSION" if ratio > args.threshold else ""
+        print(f"{key[0]:>24} {key[1]:<48} x{ratio:.2f}{flag}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(rows)} comparisons, {len(regressions)} regressions above x{args.threshold}")
+    if regressions:
+        raise SystemExit(1)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="dress_modifier benchmarks")
+    parser.add_argument("--json", help="Write results to this JSON file")
+    parser.add_argument("--repeat", type=int, default=5)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fallback = commands.add_parser("fallback", help="Fallback recolor vs the legacy implementation")
+    fallback.add_argument("--sizes", type=int, nargs="+", default=[512, 2048, 4096])
+    fallback.add_argument("--coverage", type=float, default=0.3)
+    fallback.set_defaults(run=bench_fallback)
+
+    quantized = commands.add_parser("quantized", help="int8 dynamic quantization vs float32 pipeline")
+    quantized.add_argument("--size", type=int, default=512)
+    quantized.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET)
+    quantized.add_argument("--coverage", type=float, default=0.3)
+    quantized.set_defaults(run=bench_quantized)
+
+    onnx = commands.add_parser("onnx", help="ONNX Runtime backend vs torch: latency and graph parity")
+    onnx.add_argument("--size", type=int, default=512)
+    onnx.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET)
+    onnx.add_argument("--coverage", type=float, default=0.3)
+    onnx.set_defaults(run=bench_onnx)
+
+    presets = commands.add_parser("presets", help="Latency of each quality preset")
+    presets.add_argument("--size", type=int, default=512)
+    presets.add_argument("--coverage", type=float, default=0.3)
+    presets.set_defaults(run=bench_presets)
+
+    workers = commands.add_parser("workers", help="Worker-pool throughput for several worker counts")
+    workers.add_argument("--counts", type=int, nargs="+", default=[1, 2, 4])
+    workers.add_argument("--requests", type=int, default=16)
+    workers.add_argument("--batch-size", type=int, default=4)
+    workers.add_argument("--size", type=int, default=512)
+    workers.add_argument("--coverage", type=float, default=0.3)
+    workers.add_argument("--preset", choices=list(PRESETS), default="draft")
+    workers.set_defaults(run=bench_workers)
+
+    latents = commands.add_parser("latents", help="Repeated prompts on one photo with and without the latent cache")
+    latents.add_argument("--size", type=int, default=512)
+    latents.add_argument("--coverage", type=float, default=0.3)
+    latents.add_argument("--preset", choices=list(PRESETS), default="draft")
+    latents.set_defaults(run=bench_latents)
+
+    variants = commands.add_parser("variants", help="Batched variants against one call per variant")
+    variants.add_argument("--size", type=int, default=512)
+    variants.add_argument("--count", type=int, default=4)
+    variants.add_argument("--coverage", type=float, default=0.3)
+    variants.add_argument("--preset", choices=list(PRESETS), default="draft")
+    variants.set_defaults(run=bench_variants)
+
+    memory = commands.add_parser("memory", help="Latency cost and peak memory of each memory mode")
+    memory.add_argument("--size", type=int, default=512)
+    memory.add_argument("--batch-size", type=int, default=2)
+    memory.add_argument("--coverage", type=float, default=0.3)
+    memory.add_argument("--modes", nargs="+", choices=list(MEMORY_MODES), default=list(MEMORY_MODES))
+    memory.add_argument("--preset", choices=list(PRESETS), default="draft")
+    memory.set_defaults(run=bench_memory)
+
+    imports = commands.add_parser("imports", help="Cold import and --help time against a budget")
+    imports.add_argument("--budget", type=float, default=1.0,
+                         help="Seconds allowed per check, interpreter start included")
+    imports.set_defaults(run=bench_imports)
+
+    suite = commands.add_parser("suite", help="End-to-end and per-function latency with a stub or tiny pipeline")
+    suite.add_argument("--pipeline", choices=["stub", "tiny"], default="stub",
+                       help="stub: deterministic, weight-free; tiny: randomly initialised SD2-style pipeline")
+    suite.add_argument("--step-ms", type=float, default=0.0, help="Simulated per-step cost of the stub pipeline")
+    suite.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048])
+    suite.add_argument("--coverages", type=float, nargs="+", default=[0.05, 0.3, 0.7])
+    suite.add_argument("--modes", nargs="+", choices=["resize", "crop", "tiled"], default=["resize", "crop"])
+    suite.add_argument("--preset", choices=list(PRESETS), default="draft")
+    suite.add_argument("--batch-size", type=int, default=4)
+    suite.add_argument("--requests", type=int, default=16, help="Concurrent requests for the throughput run")
+    suite.set_defaults(run=bench_suite)
+
+    compare = commands.add_parser("compare", help="Compare two suite JSON files and flag regressions")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=1.15, help="Slowdown ratio counted as a regression")
+    compare.set_defaults(run=bench_compare)
+
+    args = parser.parse_args()
+    results = args.run(args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"command": args.command, "results": results}, f, indent=2)
+        print(f"Results saved to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,87 +1,142 @@
-import torch
-import numpy as np
-from PIL import Image
-import os
-from diffusers import StableDiffusionInpaintPipeline
-
-def load_model():
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    print(f"Using device: {device}")
-    
-    try:
-        print("Loading Stable Diffusion model...")
-        pipe = StableDiffusionInpaintPipeline.from_pretrained(
-            "stabilityai/stable-diffusion-2-inpainting",
-            torch_dtype=torch.float16 if device == "cuda" else torch.float32,
-        ).to(device)
-        print("✅ Model loaded successfully")
-        return pipe, device
-    except Exception as e:
-        print(f"Error loading model: {str(e)}")
-        return None, device
-
-def modify_dress(image_path, mask_path, prompt, pipe, device):
-    if not os.path.exists(image_path) or not os.path.exists(mask_path):
-        return None, "Image or mask file not found"
-    
-    image = Image.open(image_path).convert('RGB')
-    mask = Image.open(mask_path).convert('L')
-    
-    if pipe is None:
-        return fallback_modify(image, mask, prompt), "Using fallback method (AI model failed to load)"
-    
-    try:
-        fashion_prompt = f"{prompt}, fashion photography, detailed fabric, high quality"
-        result = pipe(
-            prompt=fashion_prompt,
-            image=image,
-            mask_image=mask,
-            guidance_scale=7.5,
-            num_inference_steps=30,
-        ).images[0]
-        return result, f"✅ Dress modified: {prompt}"
-    except Exception as e:
-        print(f"Error during dress modification: {e}")
-        return fallback_modify(image, mask, prompt), f"Using fallback method: {str(e)}"
-
-def fallback_modify(image, mask, prompt):
-    print("Using fallback color modification")
-    img_np = np.array(image)
-    mask_np = np.array(mask)
-    
-    if "red" in prompt.lower():
-        color = [255, 100, 100]
-    elif "blue" in prompt.lower():
-        color = [100, 100, 255]
-    elif "green" in prompt.lower():
-        color = [100, 255, 100]
-    elif "black" in prompt.lower():
-        color = [50, 50, 50]
-    elif "white" in prompt.lower():
-        color = [240, 240, 240]
-    else:
-        color = [200, 150, 200]
-    
-    for i in range(3):
-        img_np[:,:,i] = np.where(mask_np > 128, 
-                               img_np[:,:,i] * 0.3 + color[i] * 0.7, 
-                               img_np[:,:,i])
-    
-    return Image.fromarray(img_np)
-
-if __name__ == "__main__":
-    pipe, device = load_model()
-    
-    image_path = input("Enter the path to your image file (e.g., image.jpg): ")
-    mask_path = input("Enter the path to your mask file (black on white for dress area, e.g., mask.png): ")
-    prompt = input("Describe how you want to change the dress (e.g., red flowing dress): ")
-    
-    result, message = modify_dress(image_path, mask_path, prompt, pipe, device)
-    print(message)
-    
-    if result is not None:
-        result_path = "result.png"
-        result.save(result_path)
-        print(f"Result saved as {result_path}")
-    else:
+import argparse
+from PIL import Image
+import os
+from src.registry import registry
+from src.cache import ResultCache
+from src.fallback import recolor
+from src.batch_jobs import load_rows, run_batch_job
+from src.presets import PRESETS, PresetSwitcher
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dress_modifier", "results")
+
+def fashion_prompt_for(prompt):
+    return f"{prompt}, fashion photography, detailed fabric, high quality"
+
+def apply_preset(pipe, preset=None):
+    """Install a preset's scheduler and return its settings; without a preset keep the original 30 steps"""
+    if preset is None or pipe is None:
+        return {"scheduler": None, "num_inference_steps": 30, "guidance_scale": 7.5}
+    return PresetSwitcher.for_pipe(pipe).apply(preset)
+
+def load_model():
+    import torch
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    print(f"Using device: {device}")
+    
+    try:
+        print("Loading Stable Diffusion model...")
+        pipe = registry.acquire(device=device)
+        print("✅ Model loaded successfully")
+        return pipe, device
+    except Exception as e:
+        print(f"Error loading model: {str(e)}")
+        return None, device
+
+def modify_dress(image_path, mask_path, prompt, pipe, device, cache=None, settings=None):
+    if not os.path.exists(image_path) or not os.path.exists(mask_path):
+        return None, "Image or mask file not found"
+    
+    image = Image.open(image_path).convert('RGB')
+    mask = Image.open(mask_path).convert('L')
+    
+    if pipe is None:
+        return fallback_modify(image, mask, prompt), "Using fallback method (AI model failed to load)"
+    
+    settings = settings or apply_preset(pipe)
+    fashion_prompt = fashion_prompt_for(prompt)
+    # Plain torch pipeline, tagged like DressModifier.model_tag() so other configurations never match
+    model_tag = ("torch", None, "float16" if device == "cuda" else "float32", False)
+    key = ResultCache.make_key(image, mask, fashion_prompt, None, settings["guidance_scale"],
+                               settings["num_inference_steps"], 1.0, extra=model_tag, scheduler=settings["scheduler"])
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached, f"✅ Dress modified: {prompt} (cached)"
+    
+    try:
+        result = pipe(
+            prompt=fashion_prompt,
+            image=image,
+            mask_image=mask,
+            guidance_scale=settings["guidance_scale"],
+            num_inference_steps=settings["num_inference_steps"],
+        ).images[0]
+        if cache is not None:
+            cache.put(key, result)
+        return result, f"✅ Dress modified: {prompt}"
+    except Exception as e:
+        print(f"Error during dress modification: {e}")
+        return fallback_modify(image, mask, prompt), f"Using fallback method: {str(e)}"
+
+def fallback_modify(image, mask, prompt):
+    print("Using fallback color modification")
+    return recolor(image, mask, prompt)
+
+def batch_pipeline(pipe, settings):
+    """Batched pipeline call used by the non-interactive batch mode"""
+    def run(images, masks, prompts):
+        # Groups share one size; without height/width the pipeline would render every row at 512x512
+        width, height = (max(side - side % 8, 8) for side in images[0].size)
+        return pipe(
+            prompt=[fashion_prompt_for(prompt) for prompt in prompts],
+            image=images,
+            mask_image=masks,
+            height=height,
+            width=width,
+            guidance_scale=settings["guidance_scale"],
+            num_inference_steps=settings["num_inference_steps"],
+        ).images
+    return run
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Modify a dress in a photo. Without --batch, asks for one image, mask and prompt."
+    )
+    parser.add_argument("--batch", metavar="INPUT",
+                        help="Directory of photos with <name>_mask.* masks, or a CSV/JSONL manifest "
+                             "with image, mask, prompt and optional fallback and output columns")
+    parser.add_argument("--output", default="results", help="Output directory (mirrors the input tree)")
+    parser.add_argument("--prompt", help="Prompt for directory input, or for manifest rows without one")
+    parser.add_argument("--batch-size", type=int, default=4, help="Images per pipeline call")
+    parser.add_argument("--io-workers", type=int, default=4, help="Threads for decoding and saving images")
+    parser.add_argument("--fallback-workers", type=int, default=None, help="Processes for fallback-only rows")
+    parser.add_argument("--fallback-only", action="store_true", help="Skip loading the model")
+    parser.add_argument("--preset", choices=list(PRESETS),
+                        help="Quality preset: draft (fastest), standard or final (default: the original 30 steps)")
+    return parser.parse_args()
+
+def run_batch(args):
+    rows, root = load_rows(args.batch, args.prompt)
+    pipe = None if args.fallback_only else load_model()[0]
+    run_batch_job(
+        rows, root, args.output,
+        run_pipeline=batch_pipeline(pipe, apply_preset(pipe, args.preset)) if pipe is not None else None,
+        batch_size=args.batch_size,
+        io_workers=args.io_workers,
+        fallback_workers=args.fallback_workers
+    )
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.batch:
+        run_batch(args)
+        raise SystemExit(0)
+    
+    pipe, device = load_model()
+    settings = apply_preset(pipe, args.preset)
+    cache = ResultCache(cache_dir=CACHE_DIR)
+    
+    image_path = input("Enter the path to your image file (e.g., image.jpg): ")
+    mask_path = input("Enter the path to your mask file (black on white for dress area, e.g., mask.png): ")
+    prompt = input("Describe how you want to change the dress (e.g., red flowing dress): ")
+    
+    result, message = modify_dress(image_path, mask_path, prompt, pipe, device, cache, settings)
+    print(message)
+    print(f"Cache: {cache.stats()}")
+    
+    if result is not None:
+        result_path = "result.png"
+        result.save(result_path)
+        print(f"Result saved as {result_path}")
+    else:
         print("Failed to modify dress.")
\ No newline at end of file
@@ -1,24 +1,81 @@
-# from src.app import DressModifierApp
-
-# if __name__ == "__main__":
-#     app = DressModifierApp()
-#     interface = app.build_interface()
-#     interface.launch(
-#         share=False,  
-#         debug=True,
-#         server_name="localhost",
-#         server_port=7860
-#     )
-
-
-from src.app import DressModifierApp
-
-if __name__ == "__main__":
-    app = DressModifierApp()
-    interface = app.build_interface()
-    interface.launch(
-        share=True,  # Enable public sharing to avoid localhost issues
-        debug=True,
-        server_name="localhost",
-        server_port=7860
+# from src.app import DressModifierApp
+
+# if __name__ == "__main__":
+#     app = DressModifierApp()
+#     interface = app.build_interface()
+#     interface.launch(
+#         share=False,  
+#         debug=True,
+#         server_name="localhost",
+#         server_port=7860
+#     )
+
+
+import argparse
+from src.cpu_profile import CPU_PROFILES
+from src.presets import PRESETS, DEFAULT_PRESET
+from src.metrics import metrics
+from src.memory import MEMORY_MODES
+from src.model import BACKENDS
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="AI Dress Modifier web UI")
+    parser.add_argument("--cpu-profile", choices=list(CPU_PROFILES),
+                        help="CPU performance profile: threads, channels_last, bf16, torch.compile (ignored on GPU)")
+    parser.add_argument("--cpu-threads", type=int, help="Intra-op threads (default: all available cores)")
+    parser.add_argument("--quantize", action="store_true",
+                        help="Use an int8 dynamic-quantized UNet and text encoder (CPU only)")
+    parser.add_argument("--backend", choices=list(BACKENDS), default="torch",
+                        help="Inference backend: torch, or onnx for ONNX Runtime on CPU "
+                             "(the model is exported to ONNX on first use and cached)")
+    parser.add_argument("--preset", choices=list(PRESETS), default=DEFAULT_PRESET,
+                        help="Default quality preset (scheduler, steps, guidance); selectable per request in the UI")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Model worker processes, each pinned to its own cores (default: one in-process model)")
+    parser.add_argument("--cores-per-worker", type=int,
+                        help="Cores per worker (default: available cores split evenly)")
+    parser.add_argument("--memory-budget", type=float,
+                        help="Peak memory budget in GB per model process (GPU memory on CUDA, RSS on CPU); "
+                             "attention slicing, VAE slicing/tiling and offload are enabled as needed")
+    parser.add_argument("--memory-mode", choices=list(MEMORY_MODES),
+                        help="Always use this memory mode instead of choosing one from --memory-budget "
+                             "(offload is CUDA only)")
+    parser.add_argument("--api", action="store_true",
+                        help="Also serve the HTTP job API under /v1, with the UI mounted at / (no share link)")
+    parser.add_argument("--api-max-jobs", type=int, default=32,
+                        help="Unfinished API jobs accepted before answering 429")
+    parser.add_argument("--api-output-format", choices=["webp", "jpeg", "png"], default="webp",
+                        help="Encoding of API results")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve Prometheus metrics on this port (with --api they are also at /metrics)")
+    parser.add_argument("--trace-log", help="Append one JSON line of stage timings per request to this file")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    args = parse_args()
+    from src.app import DressModifierApp
+    
+    app = DressModifierApp(cpu_profile=args.cpu_profile, cpu_threads=args.cpu_threads,
+                           quantize=args.quantize, preset=args.preset, workers=args.workers,
+                           cores_per_worker=args.cores_per_worker,
+                           memory_budget=args.memory_budget * 1024 ** 3 if args.memory_budget else None,
+                           memory_mode=args.memory_mode, backend=args.backend)
+    interface = app.build_interface()
+    metrics.trace_path = args.trace_log
+    if args.metrics_port:
+        metrics.serve(args.metrics_port, extra=app.stats)
+    if args.api:
+        import gradio as gr
+        import uvicorn
+        from src.api import InferenceAPI
+        
+        server = gr.mount_gradio_app(InferenceAPI(app, max_jobs=args.api_max_jobs,
+                                                   output_format=args.api_output_format).router(), interface, path="/")
+        uvicorn.run(server, host="localhost", port=7860)
+        raise SystemExit(0)
+    interface.launch(
+        share=True,  # Enable public sharing to avoid localhost issues
+        debug=True,
+        server_name="localhost",
+        server_port=7860
     )
\ No newline at end of file
@@ -0,0 +1,279 @@
+import asyncio
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from starlette.datastructures import UploadFile
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+from .app import RESOLUTION_MODES, QUALITY_PRESETS
+from .metrics import metrics
+from .utils import OUTPUT_FORMATS, encode_image, load_image
+
+# Room for the text fields and multipart headers on top of the two files
+FORM_OVERHEAD_BYTES = 64 * 1024
+
+
+class _Job:
+    """One API request and its outcome"""
+
+    def __init__(self, prompt, mode, preset, seed, variants=1):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.mode = mode
+        self.preset = preset
+        self.seed = seed
+        self.variants = variants
+        self.status = "queued"
+        self.step = 0
+        self.total_steps = None
+        self.message = None
+        # One encoded image and its seed per variant
+        self.results = []
+        self.seeds = []
+        self.cancel_event = threading.Event()
+        self.created = time.time()
+        self.finished = None
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "step": self.step,
+            "total_steps": self.total_steps,
+            "message": self.message,
+            "mode": self.mode,
+            "preset": self.preset,
+            "variants": self.variants,
+            "seeds": self.seeds,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class InferenceAPI:
+    """Headless HTTP API in front of a DressModifierApp: submit a job, poll its status, fetch the result.
+
+    Jobs run on a dedicated thread pool that feeds the app's batch scheduler, so
+    the event loop only parses requests. At most max_jobs unfinished jobs are
+    accepted; beyond that submissions get 429 with a Retry-After header.
+    """
+
+    def __init__(self, app, max_jobs=32, executor_workers=None, max_upload_bytes=20 * 1024 ** 2,
+                 result_ttl=600, output_format="WEBP", output_quality=90):
+        self.app = app
+        self.max_jobs = max_jobs
+        self.max_upload_bytes = max_upload_bytes
+        self.result_ttl = result_ttl
+        self.output_format = output_format.upper()
+        self.output_quality = output_quality
+        # Enough threads to keep a full batch queued in the scheduler
+        self.executor = ThreadPoolExecutor(max_workers=executor_workers or app.scheduler.max_batch_size,
+                                           thread_name_prefix="dress-api")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def unfinished(self):
+        with self._lock:
+            return sum(job.finished is None for job in self._jobs.values())
+
+    def router(self):
+        """A FastAPI app with the /v1 routes, ready to be served or to have Gradio mounted on it"""
+        api = FastAPI(title="AI Dress Modifier API")
+
+        @api.post("/v1/jobs", status_code=202)
+        async def submit_job(request: Request):
+            # Multipart form with image and mask files and prompt, mode, preset, seed and variants fields.
+            # Parsed here rather than with File/Form parameters, which spool the whole body first.
+            if not self.app.modifier.is_ready and not self.app.queue_while_loading:
+                raise HTTPException(503, "The AI model is still warming up", headers={"Retry-After": "5"})
+            form = await self._read_form(request)
+            try:
+                image_bytes = await self._read_file(form, "image")
+                mask_bytes = await self._read_file(form, "mask")
+                seed, variants = _int_field(form, "seed"), _int_field(form, "variants")
+                return await self.submit(image_bytes, mask_bytes, form.get("prompt") or "",
+                                         form.get("mode") or None, form.get("preset") or None, seed,
+                                         variants or 1)
+            finally:
+                await form.close()
+
+        @api.get("/v1/jobs/{job_id}")
+        async def job_status(job_id: str):
+            return self._get(job_id).to_dict()
+
+        @api.get("/v1/jobs/{job_id}/result")
+        async def job_result(job_id: str, variant: int = 0):
+            job = self._get(job_id)
+            if job.status != "done":
+                raise HTTPException(409, f"Job is {job.status}")
+            if not 0 <= variant < len(job.results):
+                raise HTTPException(404, f"Job has {len(job.results)} variants")
+            return Response(job.results[variant], media_type=OUTPUT_FORMATS[self.output_format],
+                            headers={"X-Seed": str(job.seeds[variant])})
+
+        @api.delete("/v1/jobs/{job_id}")
+        async def cancel_job(job_id: str):
+            job = self._get(job_id)
+            job.cancel_event.set()
+            return job.to_dict()
+
+        @api.get("/v1/stats")
+        async def stats():
+            return dict(self.app.stats(), api={"unfinished_jobs": self.unfinished(), "max_jobs": self.max_jobs})
+
+        @api.get("/metrics")
+        async def prometheus_metrics():
+            return PlainTextResponse(metrics.render_prometheus(await asyncio.to_thread(self.app.stats)),
+                                     media_type="text/plain; version=0.0.4")
+
+        return api
+
+    async def submit(self, image_bytes, mask_bytes, prompt, mode=None, preset=None, seed=None, variants=1):
+        """Validate and queue one job from encoded image and mask bytes; returns its id and the URLs to poll.
+        
+        Variant i uses seed + i (a random base without a seed) and is fetched with ?variant=i.
+        """
+        # Like the preset, an unset mode means the server's configured default
+        mode = RESOLUTION_MODES.get(mode, mode) or self.app.mode
+        preset = QUALITY_PRESETS.get(preset, preset) or self.app.preset
+        if mode not in RESOLUTION_MODES.values():
+            raise HTTPException(422, f"Unknown mode '{mode}'")
+        if preset not in QUALITY_PRESETS.values():
+            raise HTTPException(422, f"Unknown preset '{preset}'")
+        if not prompt.strip():
+            raise HTTPException(422, "Prompt is empty")
+        if not 1 <= variants <= self.app.max_variants:
+            raise HTTPException(422, f"variants must be between 1 and {self.app.max_variants}")
+        if variants > 1 and mode == "tiled":
+            raise HTTPException(422, "Variants are not available in tiled mode")
+        if not self.app.modifier.is_ready and not self.app.queue_while_loading:
+            raise HTTPException(503, "The AI model is still warming up", headers={"Retry-After": "5"})
+
+        self._prune()
+        with self._lock:
+            if sum(job.finished is None for job in self._jobs.values()) >= self.max_jobs:
+                raise HTTPException(429, "Too many jobs in progress", headers={"Retry-After": "2"})
+            job = _Job(prompt, mode, preset, seed, variants)
+            self._jobs[job.id] = job
+
+        loop = asyncio.get_running_loop()
+        loop.run_in_executor(self.executor, self._run, job, image_bytes, mask_bytes)
+        return JSONResponse(
+            {"id": job.id, "status_url": f"/v1/jobs/{job.id}", "result_url": f"/v1/jobs/{job.id}/result"},
+            status_code=202
+        )
+
+    async def _read_form(self, request):
+        """Parse the multipart body as it arrives, answering 413 as soon as it exceeds the upload limit.
+        
+        A declared Content-Length over the limit is rejected before any of the
+        body is read; without one the stream is cut off at the limit.
+        """
+        limit = 2 * self.max_upload_bytes + FORM_OVERHEAD_BYTES
+        length = request.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            raise HTTPException(413, f"Request is larger than {limit} bytes")
+        if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+            raise HTTPException(422, "Expected a multipart/form-data body")
+        
+        async def capped_stream():
+            received = 0
+            async for chunk in request.stream():
+                received += len(chunk)
+                if received > limit:
+                    raise HTTPException(413, f"Request is larger than {limit} bytes")
+                yield chunk
+        
+        parser = MultiPartParser(request.headers, capped_stream(), max_files=2, max_fields=8)
+        form = None
+        try:
+            form = await parser.parse()
+            return form
+        except MultiPartException as e:
+            raise HTTPException(400, f"Malformed form: {e}")
+        finally:
+            # parse() only closes its spooled files on a MultiPartException. After the 413 from
+            # capped_stream, a client disconnect or a truncated last part, close every file that
+            # did not make it into the form (the caller closes those with form.close())
+            kept = {id(value.file) for _, value in form.multi_items() if isinstance(value, UploadFile)} if form else ()
+            for file in getattr(parser, "_files_to_close_on_error", ()):
+                if id(file) not in kept:
+                    file.close()
+
+    async def _read_file(self, form, name):
+        upload = form.get(name)
+        if not isinstance(upload, UploadFile):
+            raise HTTPException(422, f"The {name} file is missing")
+        if upload.size is not None and upload.size > self.max_upload_bytes:
+            raise HTTPException(413, f"{upload.filename} is larger than {self.max_upload_bytes} bytes")
+        return await upload.read()
+
+    def _run(self, job, image_bytes, mask_bytes):
+        """Run one job on the API executor; nothing awaits this, so every error lands in the job"""
+        try:
+            with metrics.request(source="api", mode=job.mode, preset=job.preset):
+                self._process(job, image_bytes, mask_bytes)
+        except Exception as e:
+            self._finish(job, "failed", f"❌ Error: {e}")
+
+    def _process(self, job, image_bytes, mask_bytes):
+        """Decode, run and encode one job"""
+        if job.cancel_event.is_set():
+            self._finish(job, "cancelled", "Cancelled before it started")
+            return
+        job.status = "running"
+        try:
+            with metrics.timer("decode_upload"):
+                # Resize mode only needs 512px, so large JPEGs decode at reduced scale
+                image = load_image(image_bytes, "RGB", max_size=512 if job.mode == "resize" else None)
+                mask = load_image(mask_bytes, "L")
+        except Exception as e:
+            metrics.annotate(status="bad_upload")
+            self._finish(job, "failed", f"Could not decode upload: {e}")
+            return
+
+        def progress(step, total, latents):
+            job.step, job.total_steps = step, total
+
+        results, message = self.app.modify_dress_variants(
+            image, mask, job.prompt, job.variants, job.mode, job.seed,
+            progress=progress, cancel_event=job.cancel_event, preset=job.preset
+        )
+        if results is None:
+            self._finish(job, "cancelled" if job.cancel_event.is_set() else "failed", message)
+            return
+        with metrics.timer("encode_output"):
+            job.results = [encode_image(result, self.output_format, self.output_quality) for result, _ in results]
+        job.seeds = [seed for _, seed in results]
+        self._finish(job, "done", message)
+
+    def _finish(self, job, status, message):
+        job.message = message
+        job.finished = time.time()
+        job.status = status
+
+    def _get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise HTTPException(404, "Unknown job")
+        return job
+
+    def _prune(self):
+        """Forget finished jobs once their result has been kept for result_ttl seconds"""
+        cutoff = time.time() - self.result_ttl
+        with self._lock:
+            for job_id in [i for i, job in self._jobs.items() if job.finished is not None and job.finished < cutoff]:
+                del self._jobs[job_id]
+
+
+def _int_field(form, name):
+    value = form.get(name) or None
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        raise HTTPException(422, f"{name} must be an integer")
@@ -1,118 +1,439 @@
-import gradio as gr
-from .model import DressModifier
-from .utils import resize_image, mask_to_pil
-
-class DressModifierApp:
-    def __init__(self):
-        self.modifier = DressModifier()
-    
-    def modify_dress_interface(self, image, mask_data, prompt):
-        """Interface function for Gradio"""
-        if image is None:
-            return None, "❌ Please upload an image first"
-        
-        if mask_data is None:
-            return None, "❌ Please draw on the dress area you want to change"
-        
-        if not prompt.strip():
-            return None, "❌ Please write what you want to change (e.g., 'red flowing dress')"
-        
-        try:
-            # Process inputs
-            image = resize_image(image)
-            mask = mask_to_pil(mask_data)
-            
-            # Modify the dress
-            result = self.modifier.modify_dress(image, mask, prompt)
-            
-            return result, f"✅ Dress modified: {prompt}"
-            
-        except Exception as e:
-            return None, f"❌ Error: {str(e)}"
-    
-    def build_interface(self):
-        """Build and return the Gradio interface"""
-        with gr.Blocks(title="AI Dress Modifier", theme=gr.themes.Soft()) as app:
-            
-            gr.HTML("""
-            <div style="text-align: center; margin-bottom: 20px;">
-                <h1>👗 AI Dress Modifier</h1>
-                <p>Upload a photo, mark the dress area, and describe how you want to change it!</p>
-            </div>
-            """)
-            
-            with gr.Row():
-                with gr.Column(scale=1):
-                    # Input section
-                    gr.HTML("<h3>📸 Upload & Edit</h3>")
-                    
-                    input_image = gr.Image(
-                        label="Upload your photo",
-                        type="pil",
-                        height=400
-                    )
-                    
-                    mask_editor = gr.ImageMask(
-                        label="Draw on the dress area you want to change",
-                        type="pil",
-                        height=400
-                    )
-                    
-                    prompt_input = gr.Textbox(
-                        label="Describe the dress change",
-                        placeholder="e.g., red flowing evening dress, blue floral summer dress, elegant black gown...",
-                        lines=3
-                    )
-                    
-                    modify_btn = gr.Button(
-                        "✨ Modify Dress!", 
-                        variant="primary",
-                        size="lg"
-                    )
-                    
-                with gr.Column(scale=1):
-                    # Output section
-                    gr.HTML("<h3>✨ Result</h3>")
-                    
-                    output_image = gr.Image(
-                        label="Modified dress",
-                        height=400
-                    )
-                    
-                    status_text = gr.Textbox(
-                        label="Status",
-                        interactive=False,
-                        lines=2
-                    )
-                    
-                    # Quick examples
-                    gr.HTML("<h4>💡 Example prompts:</h4>")
-                    gr.HTML("""
-                    <div style="background: #f0f0f0; padding: 10px; border-radius: 5px; font-size: 12px;">
-                    • "red flowing evening dress"<br>
-                    • "blue floral summer dress"<br>
-                    • "elegant black cocktail dress"<br>
-                    • "white wedding gown with lace"<br>
-                    • "colorful tie-dye maxi dress"
-                    </div>
-                    """)
-            
-            # Connect the function
-            modify_btn.click(
-                fn=self.modify_dress_interface,
-                inputs=[input_image, mask_editor, prompt_input],
-                outputs=[output_image, status_text]
-            )
-            
-            # Example instructions
-            gr.HTML("<br><h4>📝 How to use:</h4>")
-            gr.HTML("""
-            <ol style="font-size: 14px;">
-                <li>Upload a photo with a person wearing a dress</li>
-                <li>Use the drawing tool to mark the dress area</li>
-                <li>Write what kind of dress you want (color, style, etc.)</li>
-                <li>Click "Modify Dress!" and wait for the magic ✨</li>
-            </ol>
-            """)
-        
-        return app
\ No newline at end of file
+import asyncio
+import os
+import threading
+from .model import DressModifier, RequestCancelled, latents_to_preview, variant_seeds
+from .batching import BatchScheduler
+from .cache import ResultCache
+from .presets import DEFAULT_PRESET
+from .workers import WorkerPool
+from .metrics import metrics
+from .tiling import inpaint_tiled
+from .mask import prepare_mask
+from .singleflight import SingleFlight
+from .utils import resize_image, prepare_crop, paste_crop
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dress_modifier", "results")
+
+# Resolution modes offered in the UI
+RESOLUTION_MODES = {
+    "Standard (512px)": "resize",
+    "Full resolution, marked area only": "crop",
+    "Full resolution, tiled": "tiled",
+}
+
+# Quality/latency presets offered in the UI (see src/presets.py)
+QUALITY_PRESETS = {
+    "Draft (fastest, 10 steps)": "draft",
+    "Standard (20 steps)": "standard",
+    "Final (best quality, 30 steps)": "final",
+}
+
+class DressModifierApp:
+    def __init__(self, max_batch_size=4, max_wait=0.05, cache_dir=DEFAULT_CACHE_DIR, cache_items=64,
+                 cache_disk_bytes=1024 ** 3, background_load=True, queue_while_loading=False, warmup_size=256,
+                 mode="resize", crop_padding=0.25, crop_feather=8, tile_size=512, tile_overlap=64,
+                 preview_every=5, cpu_profile=None, cpu_threads=None, quantize=False, preset=DEFAULT_PRESET,
+                 workers=0, cores_per_worker=None, mask_cleanup=5, memory_budget=None, memory_mode=None,
+                 backend="torch"):
+        if workers:
+            # Worker processes each hold a model; the pool stands in for both the modifier and the scheduler
+            self.modifier = self.scheduler = WorkerPool(
+                workers, cores_per_worker, max_batch_size=max_batch_size, max_wait=max_wait,
+                cpu_profile=cpu_profile, quantize=quantize, warmup_size=warmup_size,
+                memory_budget=memory_budget, memory_mode=memory_mode, backend=backend
+            )
+        else:
+            # Loading in the background lets the UI come up before the weights are ready
+            self.modifier = DressModifier(background=background_load, warmup_size=warmup_size,
+                                          cpu_profile=cpu_profile, cpu_threads=cpu_threads, quantize=quantize,
+                                          memory_budget=memory_budget, memory_mode=memory_mode, backend=backend)
+            self.scheduler = BatchScheduler(self.modifier, max_batch_size=max_batch_size, max_wait=max_wait)
+        self.queue_while_loading = queue_while_loading
+        # "crop" inpaints only the masked area and "tiled" the whole photo in tiles;
+        # both keep the photo's original resolution
+        self.mode = mode
+        self.crop_padding = crop_padding
+        self.crop_feather = crop_feather
+        self.tile_size = tile_size
+        self.tile_overlap = tile_overlap
+        # Morphology kernel (pixels) that removes brush specks and fills gaps in the drawn mask
+        self.mask_cleanup = mask_cleanup
+        # Default quality preset; each request can pick another one
+        self.preset = preset
+        # Most variants one request may ask for; a full set fits in one batch
+        self.max_variants = max_batch_size
+        # Latent preview frequency while streaming progress; 0 streams step counts only
+        self.preview_every = preview_every
+        self.cache = ResultCache(max_items=cache_items, cache_dir=cache_dir, max_disk_bytes=cache_disk_bytes)
+        # Concurrent identical requests (same cache keys) share one pipeline run
+        self.flights = SingleFlight()
+    
+    def stats(self):
+        """Model, batching and cache statistics for the UI"""
+        return {
+            "model": self.modifier.load_metrics(),
+            "batching": self.scheduler.stats(),
+            "cache": self.cache.stats(),
+            "singleflight": self.flights.stats(),
+        }
+    
+    def model_status_text(self):
+        """One-line model status shown at the top of the UI"""
+        metrics = self.modifier.load_metrics()
+        if metrics["status"] == "loading":
+            return "⏳ AI model is warming up..."
+        if metrics["status"] == "fallback":
+            return "⚠️ AI model unavailable, using simple color fallback"
+        return f"✅ AI model ready (loaded in {metrics['load_seconds']}s)"
+    
+    def _run_tiles(self, tiles, tile_masks, prompt, seed, cancel_event=None, preset=None):
+        """Send a batch of tiles through the scheduler so they share one pipeline call"""
+        futures = [self.scheduler.submit(tile, tile_mask, prompt, seed, cancel_event=cancel_event, preset=preset)
+                   for tile, tile_mask in zip(tiles, tile_masks)]
+        return [future.result() for future in futures]
+    
+    def modify_dress_interface(self, image, mask_data, prompt, mode=None, seed=None, progress=None,
+                               cancel_event=None, preset=None):
+        """Interface function for Gradio"""
+        results, message = self.modify_dress_variants(image, mask_data, prompt, 1, mode, seed, progress,
+                                                      cancel_event, preset)
+        return (results[0][0] if results else None), message
+    
+    def modify_dress_variants(self, image, mask_data, prompt, variants=1, mode=None, seed=None, progress=None,
+                              cancel_event=None, preset=None):
+        """Several variants of one request, batched into a shared pipeline call.
+        
+        Returns a list of (image, seed) and a status message; variant i uses
+        seed + i (a random base when seed is None, even for one variant), so
+        any of them can be regenerated on its own.
+        """
+        if image is None:
+            return None, "❌ Please upload an image first"
+        
+        if mask_data is None:
+            return None, "❌ Please draw on the dress area you want to change"
+        
+        if not prompt.strip():
+            return None, "❌ Please write what you want to change (e.g., 'red flowing dress')"
+        
+        mode = RESOLUTION_MODES.get(mode, mode) or self.mode
+        preset = QUALITY_PRESETS.get(preset, preset) or self.preset
+        variants = int(variants or 1)
+        if variants > 1 and mode == "tiled":
+            return None, "❌ Variants are available in the standard and marked-area modes, not tiled"
+        seeds = variant_seeds(seed, variants)
+        
+        with metrics.request(mode=mode, preset=preset, variants=variants):
+            results, message = self._modify_dress(image, mask_data, prompt, mode, seeds, progress, cancel_event,
+                                                  preset)
+        return (list(zip(results, seeds)) if results else None), message
+    
+    def _run_variants(self, image, mask, prompt, seeds, progress, cancel_event, preset):
+        """Queue one request per seed together so the scheduler runs them as one batch"""
+        futures = self.scheduler.submit_variants(image, mask, prompt, seeds, progress=progress,
+                                                 cancel_event=cancel_event, preset=preset)
+        return [future.result() for future in futures]
+    
+    def _generate(self, image, mask, prompt, mode, seeds, progress, cancel_event, preset, crop=None):
+        """Run the pipeline for one request's missing seeds.
+        
+        Returns the images, a status suffix and whether any of them (or any tile)
+        is the recolor fallback rather than a model output.
+        """
+        if mode == "tiled":
+            tile_results = []
+            
+            def run_tiles(tiles, tile_masks):
+                results = self._run_tiles(tiles, tile_masks, prompt, seeds[0], cancel_event, preset)
+                tile_results.extend(results)
+                return results
+            
+            result, tile_stats = inpaint_tiled(image, mask, run_tiles, self.tile_size, self.tile_overlap,
+                                               self.scheduler.max_batch_size)
+            peak = f", peak RSS {tile_stats['rss_bytes'] / 1024 ** 2:.0f} MB" if tile_stats["rss_bytes"] else ""
+            return ([result], f" ({tile_stats['inpainted']}/{tile_stats['tiles']} tiles{peak})",
+                    _any_fallback(tile_results))
+        if mode == "crop":
+            crop_image, crop_mask, box = crop
+            crop_results = self._run_variants(crop_image, crop_mask, prompt, seeds, progress, cancel_event, preset)
+            return ([paste_crop(image, crop_result, mask, box, self.crop_feather) for crop_result in crop_results],
+                    _peak_details(crop_results[0]), _any_fallback(crop_results))
+        results = self._run_variants(image, mask, prompt, seeds, progress, cancel_event, preset)
+        return results, _peak_details(results[0]), _any_fallback(results)
+    
+    def _modify_dress(self, image, mask_data, prompt, mode, seeds, progress, cancel_event, preset):
+        """Cache lookup and dispatch for one validated request (one image per seed), with each stage timed"""
+        try:
+            # Process inputs; crop and tiled modes work on the full-resolution photo
+            if mode == "resize":
+                with metrics.timer("resize_image"):
+                    image = resize_image(image)
+            with metrics.timer("mask_prepare"):
+                compact_mask = prepare_mask(mask_data, cleanup=self.mask_cleanup)
+            # Nothing to inpaint: skip the cache and the diffusion run entirely
+            if compact_mask.is_empty:
+                metrics.annotate(status="empty_mask")
+                return [image] * len(seeds), "ℹ️ The mask is empty, nothing to change"
+            mask = compact_mask.to_image()
+            
+            # Identical image, mask, prompt and settings give an identical result, so each
+            # variant is cached under its own seed like a single request with that seed.
+            # The model tag keeps results of another backend, int8 or dtype apart; the
+            # cache is skipped until it is known.
+            model_tag = self.modifier.model_tag()
+            extra = ({
+                "resize": None,
+                "crop": ("crop", self.crop_padding, self.crop_feather),
+                "tiled": ("tiled", self.tile_size, self.tile_overlap),
+            }[mode], model_tag)
+            with metrics.timer("cache_lookup"):
+                params = self.modifier.generation_params(prompt, preset)
+                keys = [ResultCache.make_key(image, compact_mask, seed=seed, extra=extra, **params) for seed in seeds]
+                results = [self.cache.get(key) if model_tag is not None else None for key in keys]
+            missing = [index for index, result in enumerate(results) if result is None]
+            if not missing:
+                metrics.annotate(status="cached")
+                return results, f"✅ Dress modified: {prompt} (cached)"
+            
+            if not self.modifier.is_ready and not self.queue_while_loading:
+                metrics.annotate(status="loading")
+                return None, "⏳ The AI model is still warming up, please try again in a moment"
+            
+            todo = [seeds[index] for index in missing]
+            crop = None
+            if mode == "crop":
+                crop = prepare_crop(image, mask, self.crop_padding)
+                if crop[2] is None:
+                    metrics.annotate(status="empty_mask")
+                    return [image] * len(seeds), "ℹ️ The mask is empty, nothing to change"
+            
+            # Modify the dress (batched with other concurrent requests); an identical
+            # request already in flight is waited on instead of run a second time
+            with metrics.timer("inference"):
+                (generated, details, fallback), shared = self.flights.do(
+                    tuple(keys[index] for index in missing),
+                    lambda flight_progress: self._generate(image, mask, prompt, mode, todo, flight_progress,
+                                                           cancel_event, preset, crop),
+                    progress=progress, cancel_event=cancel_event
+                )
+            
+            # Fallback output (model unavailable, or this call failed) must never be cached
+            if fallback or self.modifier.load_metrics()["status"] != "ready":
+                metrics.annotate(status="fallback")
+            elif shared:
+                metrics.annotate(status="coalesced")
+            elif model_tag is not None:
+                with metrics.timer("cache_store"):
+                    for index, result in zip(missing, generated):
+                        self.cache.put(keys[index], result)
+            
+            for index, result in zip(missing, generated):
+                results[index] = result
+            return results, f"✅ Dress modified: {prompt}{details}"
+            
+        except RequestCancelled:
+            metrics.annotate(status="cancelled")
+            return None, "🛑 Cancelled"
+        except Exception as e:
+            metrics.count("errors_total", stage="interface")
+            metrics.annotate(status="error")
+            return None, f"❌ Error: {str(e)}"
+    
+    async def modify_dress_stream(self, image, mask_data, prompt, mode=None, preset=None, variants=1, seed=None):
+        """Streaming Gradio handler: yields (image, gallery, status) with per-step progress and latent previews.
+        
+        The work runs on a thread; when the generator is closed (Gradio does this
+        if the client disconnects or the event is cancelled) the request is
+        cancelled and stops at the next step. The gallery holds every variant,
+        captioned with its seed; entering that seed with one variant regenerates it.
+        """
+        loop = asyncio.get_running_loop()
+        updates = asyncio.Queue()
+        cancel_event = threading.Event()
+        
+        def progress(step, total, latents):
+            # Called on the batch worker thread
+            preview = None
+            # Worker processes report step counts only, without latents
+            if latents is not None and self.preview_every and (step % self.preview_every == 0 or step == total):
+                preview = latents_to_preview(latents)
+            loop.call_soon_threadsafe(updates.put_nowait, (step, total, preview))
+        
+        work = loop.run_in_executor(
+            None,
+            lambda: self.modify_dress_variants(image, mask_data, prompt, variants, mode,
+                                               int(seed) if seed is not None else None,
+                                               progress=progress, cancel_event=cancel_event, preset=preset)
+        )
+        last_preview = None
+        try:
+            while not work.done() or not updates.empty():
+                try:
+                    step, total, preview = await asyncio.wait_for(updates.get(), timeout=0.5)
+                except asyncio.TimeoutError:
+                    continue
+                last_preview = preview or last_preview
+                yield last_preview, None, f"⏳ Step {step}/{total}..."
+            results, message = await work
+            if results is None:
+                yield None, None, message
+                return
+            gallery = [(result, f"Seed {seed}") for result, seed in results]
+            yield results[0][0], gallery, message
+        finally:
+            # Reached on completion, disconnect or Gradio cancelling this event
+            cancel_event.set()
+    
+    def build_interface(self):
+        """Build and return the Gradio interface"""
+        # Gradio takes seconds to import; only the UI needs it, not the app or the API
+        import gradio as gr
+        
+        with gr.Blocks(title="AI Dress Modifier", theme=gr.themes.Soft()) as app:
+            
+            gr.HTML("""
+            <div style="text-align: center; margin-bottom: 20px;">
+                <h1>👗 AI Dress Modifier</h1>
+                <p>Upload a photo, mark the dress area, and describe how you want to change it!</p>
+            </div>
+            """)
+            
+            # Polls until the background loader reports the model state
+            gr.Markdown(value=self.model_status_text, every=2)
+            
+            with gr.Row():
+                with gr.Column(scale=1):
+                    # Input section
+                    gr.HTML("<h3>📸 Upload & Edit</h3>")
+                    
+                    input_image = gr.Image(
+                        label="Upload your photo",
+                        type="pil",
+                        height=400
+                    )
+                    
+                    mask_editor = gr.ImageMask(
+                        label="Draw on the dress area you want to change",
+                        type="pil",
+                        height=400
+                    )
+                    
+                    prompt_input = gr.Textbox(
+                        label="Describe the dress change",
+                        placeholder="e.g., red flowing evening dress, blue floral summer dress, elegant black gown...",
+                        lines=3
+                    )
+                    
+                    mode_radio = gr.Radio(
+                        label="Resolution",
+                        choices=list(RESOLUTION_MODES),
+                        value=next(label for label, mode in RESOLUTION_MODES.items() if mode == self.mode)
+                    )
+                    
+                    preset_dropdown = gr.Dropdown(
+                        label="Quality",
+                        choices=list(QUALITY_PRESETS),
+                        value=next(label for label, preset in QUALITY_PRESETS.items() if preset == self.preset)
+                    )
+                    
+                    # Variants run as one batch, so a few cost much less than as many clicks
+                    variants_slider = gr.Slider(
+                        label="Variants",
+                        minimum=1,
+                        maximum=self.max_variants,
+                        step=1,
+                        value=1
+                    )
+                    
+                    # Variant i uses seed + i; a seed from the gallery reproduces that variant
+                    seed_input = gr.Number(
+                        label="Seed (blank for random)",
+                        precision=0,
+                        value=None
+                    )
+                    
+                    with gr.Row():
+                        modify_btn = gr.Button(
+                            "✨ Modify Dress!", 
+                            variant="primary",
+                            size="lg"
+                        )
+                        cancel_btn = gr.Button("🛑 Cancel", size="lg")
+                    
+                with gr.Column(scale=1):
+                    # Output section
+                    gr.HTML("<h3>✨ Result</h3>")
+                    
+                    output_image = gr.Image(
+                        label="Modified dress",
+                        format="webp",
+                        height=400
+                    )
+                    
+                    variants_gallery = gr.Gallery(
+                        label="Variants (each reproducible from its seed)",
+                        format="webp",
+                        columns=4,
+                        height=200
+                    )
+                    
+                    status_text = gr.Textbox(
+                        label="Status",
+                        interactive=False,
+                        lines=2
+                    )
+                    
+                    # Quick examples
+                    gr.HTML("<h4>💡 Example prompts:</h4>")
+                    gr.HTML("""
+                    <div style="background: #f0f0f0; padding: 10px; border-radius: 5px; font-size: 12px;">
+                    • "red flowing evening dress"<br>
+                    • "blue floral summer dress"<br>
+                    • "elegant black cocktail dress"<br>
+                    • "white wedding gown with lace"<br>
+                    • "colorful tie-dye maxi dress"
+                    </div>
+                    """)
+                    
+                    with gr.Accordion("📊 Server stats", open=False):
+                        stats_json = gr.JSON(label="Model, batching & cache")
+                        stats_btn = gr.Button("Refresh", size="sm")
+            
+            # Connect the function; allow enough concurrent clicks to fill a batch
+            modify_event = modify_btn.click(
+                fn=self.modify_dress_stream,
+                inputs=[input_image, mask_editor, prompt_input, mode_radio, preset_dropdown, variants_slider,
+                        seed_input],
+                outputs=[output_image, variants_gallery, status_text],
+                concurrency_limit=self.scheduler.max_batch_size
+            )
+            
+            cancel_btn.click(fn=None, cancels=[modify_event])
+            
+            stats_btn.click(fn=self.stats, outputs=stats_json)
+            
+            # Example instructions
+            gr.HTML("<br><h4>📝 How to use:</h4>")
+            gr.HTML("""
+            <ol style="font-size: 14px;">
+                <li>Upload a photo with a person wearing a dress</li>
+                <li>Use the drawing tool to mark the dress area</li>
+                <li>Write what kind of dress you want (color, style, etc.)</li>
+                <li>Click "Modify Dress!" and wait for the magic ✨</li>
+            </ol>
+            """)
+        
+        return app
+
+
+def _peak_details(result):
+    """Status suffix with the peak RSS of the pipeline call that produced result, if known"""
+    peak = result.info.get("peak_rss_bytes")
+    if peak is None:
+        return ""
+    metrics.annotate(pipeline_peak_rss_bytes=peak)
+    return f" (peak RSS {peak / 1024 ** 2:.0f} MB)"
+
+
+def _any_fallback(results):
+    return any(result.info.get("fallback") for result in results)
@@ -0,0 +1,271 @@
+import csv
+import json
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from PIL import Image
+
+from .fallback import recolor
+from .utils import load_image
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".webp")
+MASK_SUFFIX = "_mask"
+
+
+def _truthy(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "y")
+
+
+def discover_directory(root, prompt):
+    """Rows for every photo under root that has a sibling <name>_mask.* file"""
+    rows = []
+    for dirpath, _, files in os.walk(root):
+        masks = {os.path.splitext(name)[0]: name for name in files
+                 if os.path.splitext(name)[0].endswith(MASK_SUFFIX)}
+        for name in sorted(files):
+            stem, ext = os.path.splitext(name)
+            if ext.lower() not in IMAGE_EXTENSIONS or stem.endswith(MASK_SUFFIX):
+                continue
+            mask_name = masks.get(stem + MASK_SUFFIX)
+            if mask_name is None:
+                print(f"Skipping {name}: no {stem}{MASK_SUFFIX}.* mask found")
+                continue
+            rows.append({
+                "image": os.path.join(dirpath, name),
+                "mask": os.path.join(dirpath, mask_name),
+                "prompt": prompt,
+                "fallback": False,
+            })
+    return rows
+
+
+def _inside(relative):
+    """Whether a relative path stays inside the directory it is relative to"""
+    relative = os.path.normpath(relative)
+    return not os.path.isabs(relative) and relative != os.pardir and not relative.startswith(os.pardir + os.sep)
+
+
+def load_manifest(path, default_prompt=None):
+    """Rows from a CSV or JSONL manifest with image, mask and optional prompt, fallback and output columns.
+    
+    Rows without a prompt (missing or empty) use default_prompt. Each row is
+    written to its output column, or to <image>.<row number>.png, so rows that
+    reuse a photo with another mask or prompt do not collide.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    rows = []
+    for number, record in enumerate(records, 1):
+        prompt = record.get("prompt") or default_prompt
+        if not prompt:
+            raise ValueError(f"Row {number} of {path} has no prompt; add one or pass --prompt")
+        image = os.path.join(base, record["image"])
+        if not _inside(os.path.relpath(image, base)):
+            raise ValueError(f"Row {number} of {path}: image {record['image']} is outside {base}")
+        if record.get("output"):
+            name = os.path.splitext(record["output"])[0]
+        else:
+            name = f"{os.path.splitext(os.path.relpath(image, base))[0]}.{number}"
+        if not _inside(name):
+            raise ValueError(f"Row {number} of {path}: output {name} is outside the output directory")
+        rows.append({
+            "image": image,
+            "mask": os.path.join(base, record["mask"]),
+            "prompt": prompt,
+            "fallback": _truthy(record.get("fallback", False)),
+            "name": os.path.normpath(name),
+        })
+    return rows
+
+
+def load_rows(source, prompt=None):
+    """Rows plus the root that output paths are made relative to"""
+    if os.path.isdir(source):
+        if not prompt:
+            raise ValueError("--prompt is required when the batch input is a directory")
+        return discover_directory(source, prompt), os.path.abspath(source)
+    return load_manifest(source, prompt), os.path.dirname(os.path.abspath(source))
+
+
+class Checkpoint:
+    """Append-only JSONL progress file so an interrupted run can resume.
+
+    done maps each finished row id to the backend ("model" or "fallback") that
+    produced it, or None for entries written before backends were recorded.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from a killed run
+                    if entry.get("status") == "done":
+                        self.done[entry["id"]] = entry.get("backend")
+
+    def record(self, row_id, status, **details):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"id": row_id, "status": status, **details}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if status == "done":
+                self.done[row_id] = details.get("backend")
+
+
+def row_id(row, root):
+    """Checkpoint id of a row: its output name, or for directory rows the image path relative to root"""
+    relative = row.get("name") or os.path.relpath(row["image"], root)
+    if not _inside(relative):
+        raise ValueError(f"{row['image']} is outside {root}")
+    return relative
+
+
+def output_path(row, root, output_dir):
+    relative = row_id(row, root)
+    # Manifest names carry no extension (and may end in .<row number>)
+    return os.path.join(output_dir, (relative if row.get("name") else os.path.splitext(relative)[0]) + ".png")
+
+
+def _decode(row):
+    """Load and downscale one row's image and mask (runs on the I/O thread pool)"""
+    with Image.open(row["image"]) as source:
+        row["size"] = source.size
+    image = load_image(row["image"], "RGB", max_size=512)
+    mask = load_image(row["mask"], "L").resize(image.size, Image.Resampling.NEAREST)
+    return row, image, mask
+
+
+def _save(image, path, size=None):
+    if size is not None and image.size != tuple(size):
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+
+
+def fallback_job(image_path, mask_path, prompt, out_path):
+    """Fallback recolor of one row at full resolution (runs on the process pool)"""
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+    with Image.open(mask_path) as mask:
+        result = recolor(image, mask, prompt)
+    _save(result, out_path)
+    return out_path
+
+
+def _prefetch(rows, pool, depth):
+    """Yield (row, image, mask, error) in order while keeping `depth` decodes in flight"""
+    pending = deque()
+    rows = iter(rows)
+    for row in rows:
+        pending.append((row, pool.submit(_decode, row)))
+        if len(pending) >= depth:
+            break
+    while pending:
+        row, future = pending.popleft()
+        next_row = next(rows, None)
+        if next_row is not None:
+            pending.append((next_row, pool.submit(_decode, next_row)))
+        try:
+            _, image, mask = future.result()
+        except Exception as e:
+            yield row, None, None, e
+        else:
+            yield row, image, mask, None
+
+
+def run_batch_job(rows, root, output_dir, run_pipeline=None, batch_size=4, io_workers=4, fallback_workers=None,
+                  prefetch=None):
+    """Process rows into a parallel tree under output_dir, skipping rows already checkpointed.
+
+    run_pipeline(images, masks, prompts) returns one image per input; rows marked
+    fallback, or all rows when run_pipeline is None, go to a process pool instead.
+    Model rows run at most 512 px on the long side and are scaled back to the
+    photo's original size, so every output matches its source like fallback rows do.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(output_dir, "progress.jsonl"))
+
+    todo = []
+    for row in rows:
+        row["id"] = row_id(row, root)
+        row["output"] = output_path(row, root, output_dir)
+        row["backend"] = "fallback" if run_pipeline is None or row["fallback"] else "model"
+        # A row recolored while the model was unavailable runs again once the model loads
+        if row["id"] not in checkpoint.done or checkpoint.done[row["id"]] not in (None, row["backend"]):
+            todo.append(row)
+
+    model_rows = [row for row in todo if row["backend"] == "model"]
+    fallback_rows = [row for row in todo if row["backend"] == "fallback"]
+    total = len(todo)
+    print(f"{len(rows) - total} already done, {len(model_rows)} model rows, {len(fallback_rows)} fallback rows")
+
+    counter = {"done": 0, "failed": 0}
+    counter_lock = threading.Lock()
+
+    def finish(row, error=None):
+        with counter_lock:
+            if error is None:
+                checkpoint.record(row["id"], "done", output=row["output"], backend=row["backend"])
+                counter["done"] += 1
+            else:
+                checkpoint.record(row["id"], "failed", error=str(error))
+                counter["failed"] += 1
+            print(f"[{counter['done'] + counter['failed']}/{total}] {row['id']}"
+                  + (f" failed: {error}" if error is not None else ""))
+
+    with ProcessPoolExecutor(max_workers=fallback_workers) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=io_workers) as io_pool:
+        # Fallback rows are pure CPU work, so they run in parallel processes from the start
+        fallback_futures = []
+        for row in fallback_rows:
+            future = cpu_pool.submit(fallback_job, row["image"], row["mask"], row["prompt"], row["output"])
+            future.add_done_callback(lambda f, row=row: finish(row, f.exception()))
+            fallback_futures.append(future)
+
+        # Model rows: decode ahead on threads, group same-sized images into pipeline batches
+        save_futures = []
+        groups = {}
+
+        def flush(size):
+            group = groups.pop(size)
+            try:
+                results = run_pipeline([g[1] for g in group], [g[2] for g in group], [g[0]["prompt"] for g in group])
+            except Exception as e:
+                for row, _, _ in group:
+                    finish(row, e)
+                return
+            for (row, _, _), result in zip(group, results):
+                future = io_pool.submit(_save, result, row["output"], row["size"])
+                future.add_done_callback(lambda f, row=row: finish(row, f.exception()))
+                save_futures.append(future)
+
+        for row, image, mask, error in _prefetch(model_rows, io_pool, prefetch or io_workers * 2):
+            if error is not None:
+                finish(row, error)
+                continue
+            groups.setdefault(image.size, []).append((row, image, mask))
+            if len(groups[image.size]) >= batch_size:
+                flush(image.size)
+        for size in list(groups):
+            flush(size)
+
+        for future in save_futures + fallback_futures:
+            future.exception()
+
+    print(f"✅ Batch finished: {counter['done']} done, {counter['failed']} failed, outputs in {output_dir}")
+    return counter
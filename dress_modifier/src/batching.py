@@ -0,0 +1,192 @@
+import threading
+import time
+from concurrent.futures import Future
+
+from .model import RequestCancelled
+
+
+class _PendingRequest:
+    """A single modify request waiting in the batch queue"""
+
+    def __init__(self, image, mask, prompt, seed=None, progress=None, cancel_event=None, batch_key=None,
+                 preset=None):
+        self.image = image
+        self.mask = mask
+        self.prompt = prompt
+        self.seed = seed
+        self.preset = preset
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        # The pipeline can only stack images of the same (possibly bucketed) size and preset into one batch
+        self.batch_key = batch_key or (image.size, preset)
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def cancel(self):
+        if not self.future.done():
+            self.future.set_exception(RequestCancelled("Request was cancelled"))
+
+
+class BatchScheduler:
+    """Collects requests arriving within a short window and runs them as one batched pipeline call"""
+
+    def __init__(self, modifier, max_batch_size=4, max_wait=0.05):
+        self.modifier = modifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+
+        self._batches = 0
+        self._requests = 0
+        self._batch_sizes = {}
+        self._busy_seconds = 0.0
+        self._cancelled = 0
+
+        self._worker = threading.Thread(target=self._run, name="dress-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, image, mask, prompt, seed=None, progress=None, cancel_event=None, preset=None):
+        """Queue a request and return a Future resolving to the modified image.
+        
+        progress(step, total_steps, latents) is called from the worker thread after
+        each denoising step. Setting cancel_event drops the request from the queue,
+        or stops its batch at the next step once every request in it is cancelled.
+        """
+        return self.submit_variants(image, mask, prompt, [seed], progress, cancel_event, preset)[0]
+
+    def submit_variants(self, image, mask, prompt, seeds, progress=None, cancel_event=None, preset=None):
+        """Queue one request per seed at once so they share a batch; returns one Future per seed.
+        
+        Only the first variant reports progress, so callers see one step count per step.
+        """
+        batch_key = self.modifier.batch_key(image.size, preset) if hasattr(self.modifier, "batch_key") else None
+        requests = [_PendingRequest(image, mask, prompt, seed, progress if index == 0 else None, cancel_event,
+                                    batch_key, preset)
+                    for index, seed in enumerate(seeds)]
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Batch scheduler is closed")
+            self._pending.extend(requests)
+            self._cond.notify()
+        return [request.future for request in requests]
+
+    def modify_dress(self, image, mask, prompt, seed=None, timeout=None, progress=None, cancel_event=None,
+                     preset=None):
+        """Blocking drop-in replacement for DressModifier.modify_dress"""
+        return self.submit(image, mask, prompt, seed, progress, cancel_event, preset).result(timeout)
+
+    def close(self):
+        """Stop accepting requests and let the worker drain the queue"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._worker.join()
+
+    def stats(self):
+        """Queue depth and batch-size statistics"""
+        with self._cond:
+            return {
+                "queue_depth": len(self._pending),
+                "batches": self._batches,
+                "requests": self._requests,
+                "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "images_per_second": round(self._requests / self._busy_seconds, 3) if self._busy_seconds else 0.0,
+                "cancelled": self._cancelled,
+            }
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._process(batch)
+
+    def _drop_cancelled(self):
+        for request in [r for r in self._pending if r.cancelled]:
+            self._pending.remove(request)
+            request.cancel()
+            self._cancelled += 1
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                self._drop_cancelled()
+                if self._pending or self._closed:
+                    break
+                self._cond.wait()
+            if not self._pending:
+                return None
+
+            # Wait until the oldest request has been queued for max_wait, or the batch is full
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while True:
+                key = self._pending[0].batch_key
+                batch = [r for r in self._pending if r.batch_key == key][:self.max_batch_size]
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0 or self._closed:
+                    break
+                self._cond.wait(remaining)
+                self._drop_cancelled()
+                if not self._pending:
+                    return []
+
+            for request in batch:
+                self._pending.remove(request)
+            return batch
+
+    def _on_step(self, batch, step, total, latents):
+        """Fan step progress out to each caller; abort once nobody is waiting"""
+        live = 0
+        for index, request in enumerate(batch):
+            if request.future.done():
+                continue
+            if request.cancelled:
+                # Frees the caller right away even if the rest of the batch keeps going
+                request.cancel()
+                with self._cond:
+                    self._cancelled += 1
+                continue
+            live += 1
+            if request.progress is not None:
+                try:
+                    request.progress(step, total, latents[index:index + 1] if latents is not None else None)
+                except Exception as e:
+                    print(f"Progress callback failed: {e}")
+        if not live:
+            raise RequestCancelled("Every request in the batch was cancelled")
+
+    def _process(self, batch):
+        if not batch:
+            return
+        started = time.monotonic()
+        try:
+            results = self.modifier.modify_dress_batch(
+                [r.image for r in batch],
+                [r.mask for r in batch],
+                [r.prompt for r in batch],
+                [r.seed for r in batch],
+                step_callback=lambda step, total, latents: self._on_step(batch, step, total, latents),
+                preset=batch[0].preset
+            )
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        else:
+            for request, result in zip(batch, results):
+                if not request.future.done():
+                    request.future.set_result(result)
+
+        with self._cond:
+            self._batches += 1
+            self._requests += len(batch)
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._busy_seconds += time.monotonic() - started
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+from .mask import CompactMask
+
+
+def _update_hash(digest, value):
+    """Feed an image, array or scalar into a hashlib digest"""
+    if isinstance(value, Image.Image):
+        digest.update(f"img:{value.mode}:{value.size}".encode())
+        digest.update(value.tobytes())
+    elif isinstance(value, CompactMask):
+        # Packed bits: an eighth of the data of the equivalent "L" image
+        digest.update(f"mask:{value.size}".encode())
+        digest.update(value.bits)
+    elif isinstance(value, np.ndarray):
+        array = np.ascontiguousarray(value)
+        digest.update(f"arr:{array.dtype}:{array.shape}".encode())
+        digest.update(array.data)
+    else:
+        digest.update(repr(value).encode())
+    digest.update(b"\0")
+
+
+class LRUCache:
+    """Thread-safe, size-bounded in-memory LRU mapping"""
+
+    def __init__(self, max_items=64):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._items:
+                return default
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._items
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+
+class ResultCache:
+    """Content-addressed cache of modified images: memory LRU in front of a size-bounded disk store"""
+
+    def __init__(self, max_items=64, cache_dir=None, max_disk_bytes=1024 ** 3):
+        self.memory = LRUCache(max_items)
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+
+        self._lock = threading.Lock()
+        self._disk_bytes = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+        if self.cache_dir:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    @staticmethod
+    def make_key(image, mask, prompt, negative_prompt, guidance_scale, num_inference_steps, strength, seed=None,
+                 extra=None, scheduler=None):
+        """Hash every input that influences the pipeline output; extra covers mode-specific settings"""
+        digest = hashlib.sha256()
+        for value in (image, mask, prompt, negative_prompt, guidance_scale, num_inference_steps, strength, seed, extra,
+                      scheduler):
+            _update_hash(digest, value)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached image for key, or None on a miss"""
+        image = self.memory.get(key)
+        if image is not None:
+            self._count("memory_hits")
+            return image.copy()
+
+        path = self._path(key)
+        if path and os.path.exists(path):
+            try:
+                with Image.open(path) as cached:
+                    image = cached.copy()
+                os.utime(path)
+            except OSError:
+                image = None
+            if image is not None:
+                self.memory.put(key, image)
+                self._count("disk_hits")
+                return image.copy()
+
+        self._count("misses")
+        return None
+
+    def put(self, key, image):
+        """Store a result in memory and, if configured, on disk"""
+        self.memory.put(key, image.copy())
+        self._count("stores")
+
+        path = self._path(key)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        image.save(tmp_path, format="PNG")
+        replaced = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._disk_bytes += os.path.getsize(path) - replaced
+        self._evict()
+
+    def stats(self):
+        """Hit/miss counters and current cache sizes"""
+        with self._lock:
+            stats = dict(self._counters)
+            stats["disk_bytes"] = self._disk_bytes
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0.0
+        stats["memory_items"] = len(self.memory)
+        return stats
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def _path(self, key):
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.png")
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".png"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _evict(self):
+        """Delete least recently used files until the disk tier fits its budget"""
+        with self._lock:
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+            entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+            for path, size, _ in entries:
+                if self._disk_bytes <= self.max_disk_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                self._disk_bytes -= size
+                self._counters["evictions"] += 1
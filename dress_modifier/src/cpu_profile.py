@@ -0,0 +1,111 @@
+import contextlib
+import os
+from PIL import Image
+
+# (width, height) shapes the compiled graphs are specialised for; all multiples of 64
+RESOLUTION_BUCKETS = [
+    (512, 512),
+    (512, 384), (384, 512),
+    (576, 448), (448, 576),
+    (640, 384), (384, 640),
+]
+
+CPU_PROFILES = {
+    # Plain float32 eager mode, as before
+    "eager": {"channels_last": False, "bf16": False, "compile": False, "buckets": False},
+    # No compilation, so no start-up cost
+    "fast": {"channels_last": True, "bf16": "auto", "compile": False, "buckets": True},
+    # torch.compile of UNet and VAE; the first run per bucket compiles (cached on disk after that)
+    "compiled": {"channels_last": True, "bf16": "auto", "compile": True, "buckets": True},
+}
+
+DEFAULT_COMPILE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dress_modifier", "inductor")
+
+
+def bf16_supported():
+    """True if this CPU has native bfloat16 support (AVX512-BF16 / AMX)"""
+    import torch
+    try:
+        return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+    except (AttributeError, RuntimeError):
+        return False
+
+
+def bucket_for(size, buckets=RESOLUTION_BUCKETS):
+    """The bucket with the aspect ratio closest to size"""
+    aspect = size[0] / size[1]
+    return min(buckets, key=lambda bucket: abs(bucket[0] / bucket[1] - aspect))
+
+
+def snap_to_bucket(image, mask, buckets=RESOLUTION_BUCKETS):
+    """Resize image and mask to the bucket with the closest aspect ratio"""
+    size = bucket_for(image.size, buckets)
+    if image.size == size:
+        return image, mask
+    return (image.resize(size, Image.Resampling.LANCZOS),
+            mask.convert('L').resize(size, Image.Resampling.NEAREST))
+
+
+def configure_threads(threads=None, interop_threads=None):
+    """Pin intra-op and inter-op thread pools (inter-op can only be set once per process)"""
+    import torch
+    
+    if not threads:
+        threads = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Could not set inter-op threads: {e}")
+    return threads
+
+
+def enable_compile_cache(cache_dir=DEFAULT_COMPILE_CACHE_DIR):
+    """Persist Inductor's FX graph and kernel caches so restarts reuse compiled artifacts"""
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", cache_dir)
+    os.environ.setdefault("TORCHINDUCTOR_FX_GRAPH_CACHE", "1")
+    import torch._inductor.config as inductor_config
+    inductor_config.fx_graph_cache = True
+
+
+def apply_cpu_profile(pipe, profile="fast", threads=None, interop_threads=None,
+                      compile_cache_dir=DEFAULT_COMPILE_CACHE_DIR, allow_bf16=True):
+    """Tune a CPU pipeline in place.
+
+    Returns a dict with an `autocast` context factory to wrap pipeline calls
+    in, and the resolution `buckets` inputs should be snapped to (or None).
+    Pass allow_bf16=False for int8-quantized pipelines, whose kernels expect float32.
+    """
+    import torch
+
+    settings = CPU_PROFILES[profile]
+    applied = {"profile": profile, "threads": configure_threads(threads, interop_threads)}
+
+    if settings["channels_last"]:
+        pipe.unet.to(memory_format=torch.channels_last)
+        pipe.vae.to(memory_format=torch.channels_last)
+
+    use_bf16 = bf16_supported() if settings["bf16"] == "auto" else settings["bf16"]
+    use_bf16 = use_bf16 and allow_bf16
+    applied["bf16"] = bool(use_bf16)
+    if use_bf16:
+        applied["autocast"] = lambda: torch.autocast("cpu", dtype=torch.bfloat16)
+    else:
+        applied["autocast"] = contextlib.nullcontext
+
+    if settings["compile"]:
+        enable_compile_cache(compile_cache_dir)
+        import torch._dynamo
+        # One graph per bucket and batch size; keep them all instead of recompiling
+        torch._dynamo.config.cache_size_limit = max(torch._dynamo.config.cache_size_limit, 64)
+        pipe.unet = torch.compile(pipe.unet, dynamic=False)
+        pipe.vae.encoder = torch.compile(pipe.vae.encoder, dynamic=False)
+        pipe.vae.decoder = torch.compile(pipe.vae.decoder, dynamic=False)
+    applied["compiled"] = settings["compile"]
+
+    applied["buckets"] = RESOLUTION_BUCKETS if settings["buckets"] else None
+    print(f"⚙️ CPU profile '{profile}': {applied['threads']} threads, bf16={applied['bf16']}, "
+          f"compiled={applied['compiled']}")
+    return applied
@@ -0,0 +1,145 @@
+import re
+import numpy as np
+from PIL import Image
+
+# Prompt vocabulary for the fallback recolor, RGB
+COLOR_NAMES = {
+    "red": (220, 30, 40),
+    "dark red": (130, 20, 30),
+    "crimson": (200, 20, 60),
+    "scarlet": (235, 40, 20),
+    "burgundy": (128, 0, 32),
+    "maroon": (110, 20, 35),
+    "wine": (115, 30, 50),
+    "pink": (255, 150, 190),
+    "hot pink": (255, 60, 160),
+    "blush": (240, 190, 190),
+    "rose": (230, 100, 130),
+    "magenta": (230, 30, 180),
+    "fuchsia": (240, 50, 200),
+    "orange": (255, 130, 30),
+    "coral": (255, 120, 90),
+    "peach": (255, 200, 160),
+    "rust": (180, 70, 30),
+    "yellow": (250, 220, 40),
+    "mustard": (215, 170, 40),
+    "gold": (215, 175, 55),
+    "golden": (215, 175, 55),
+    "cream": (250, 240, 215),
+    "ivory": (250, 245, 230),
+    "beige": (225, 205, 170),
+    "tan": (210, 180, 140),
+    "khaki": (195, 175, 125),
+    "brown": (120, 75, 40),
+    "chocolate": (90, 50, 25),
+    "camel": (195, 150, 95),
+    "green": (40, 160, 70),
+    "dark green": (20, 90, 40),
+    "emerald": (20, 140, 90),
+    "olive": (110, 120, 40),
+    "sage": (160, 180, 145),
+    "mint": (170, 230, 190),
+    "lime": (160, 220, 50),
+    "teal": (20, 130, 130),
+    "turquoise": (60, 200, 195),
+    "cyan": (40, 200, 230),
+    "aqua": (80, 210, 220),
+    "blue": (40, 80, 220),
+    "light blue": (150, 190, 240),
+    "sky blue": (120, 190, 240),
+    "baby blue": (170, 205, 240),
+    "dark blue": (20, 40, 120),
+    "navy": (20, 30, 90),
+    "navy blue": (20, 30, 90),
+    "royal blue": (40, 70, 200),
+    "cobalt": (0, 70, 170),
+    "denim": (70, 100, 150),
+    "indigo": (70, 40, 130),
+    "purple": (120, 50, 160),
+    "violet": (140, 80, 200),
+    "lavender": (190, 160, 225),
+    "lilac": (200, 160, 210),
+    "plum": (120, 50, 100),
+    "mauve": (190, 140, 170),
+    "white": (245, 245, 245),
+    "off white": (240, 236, 225),
+    "black": (25, 25, 25),
+    "grey": (130, 130, 130),
+    "gray": (130, 130, 130),
+    "charcoal": (60, 65, 70),
+    "silver": (195, 195, 200),
+}
+DEFAULT_COLOR = (200, 150, 200)  # Purple, as before
+
+# Longest names first so "navy blue" wins over "blue"
+_COLOR_PATTERN = re.compile(
+    r"#[0-9a-fA-F]{6}\b|\b(" + "|".join(re.escape(name) for name in sorted(COLOR_NAMES, key=len, reverse=True)) + r")\b",
+    re.IGNORECASE
+)
+
+
+def parse_color(prompt):
+    """First color mentioned in the prompt (name or #rrggbb), or DEFAULT_COLOR"""
+    match = _COLOR_PATTERN.search(prompt or "")
+    if match is None:
+        return DEFAULT_COLOR
+    text = match.group(0)
+    if text.startswith("#"):
+        return tuple(int(text[i:i + 2], 16) for i in (1, 3, 5))
+    return COLOR_NAMES[text.lower()]
+
+
+def _mask_image(mask, size):
+    """Mask as an 'L' image matching the photo size"""
+    if isinstance(mask, dict) and 'mask' in mask:
+        mask = mask['mask']
+    if not isinstance(mask, Image.Image):
+        mask = Image.fromarray(np.asarray(mask))
+    mask = mask.convert('L')
+    if mask.size != size:
+        mask = mask.resize(size, Image.Resampling.BILINEAR)
+    return mask
+
+
+def recolor(image, mask, prompt="", color=None, strength=0.85, feather=0):
+    """Recolor the masked area in CIELAB, keeping the fabric's shading and texture.
+
+    Chroma (a*, b*) is replaced by the target color's and lightness is shifted
+    so its masked mean matches the target, which keeps folds and texture.
+    Soft (feathered) masks blend proportionally. Only the mask's bounding box
+    is converted to numpy and processed, on uint8 buffers with float32 blend weights.
+    """
+    import cv2
+
+    output = image.convert('RGB') if image.mode != 'RGB' else image.copy()
+    mask = _mask_image(mask, image.size)
+    if color is None:
+        color = parse_color(prompt)
+
+    bbox = mask.getbbox()
+    if bbox is None:
+        return output
+    if feather:
+        margin = int(3 * feather) + 1
+        bbox = (max(bbox[0] - margin, 0), max(bbox[1] - margin, 0),
+                min(bbox[2] + margin, image.width), min(bbox[3] + margin, image.height))
+
+    region = np.array(output.crop(bbox))
+    region_mask = np.asarray(mask.crop(bbox))
+    if feather:
+        region_mask = cv2.GaussianBlur(region_mask, (0, 0), feather)
+
+    lab = cv2.cvtColor(region, cv2.COLOR_RGB2LAB)
+    target = cv2.cvtColor(np.array([[color]], dtype=np.uint8), cv2.COLOR_RGB2LAB)[0, 0]
+
+    # Shift lightness toward the target but keep each pixel's deviation from the mean (the shading)
+    mean_l = cv2.mean(lab, mask=region_mask)[0]
+    shift = np.clip(np.arange(256, dtype=np.float32) + (float(target[0]) - mean_l), 0, 255).astype(np.uint8)
+    recolored = np.empty_like(lab)
+    recolored[..., 0] = cv2.LUT(lab[..., 0], shift)
+    recolored[..., 1:] = target[1:]
+
+    weight = region_mask.astype(np.float32) * (strength / 255.0)
+    lab = cv2.blendLinear(recolored, lab, weight, 1.0 - weight)
+    output.paste(Image.fromarray(cv2.cvtColor(lab, cv2.COLOR_LAB2RGB)), bbox[:2])
+    return output
@@ -0,0 +1,164 @@
+import sys
+import threading
+
+
+def _read_status_bytes(field):
+    """Read a kB field such as VmHWM from /proc/self/status (Linux only)"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def _loaded_cuda():
+    """torch.cuda if torch is already imported and sees a GPU; nothing can be on the GPU before that"""
+    torch = sys.modules.get("torch")
+    if torch is not None and torch.cuda.is_available():
+        return torch.cuda
+    return None
+
+
+def reset_peak_memory():
+    """Reset the process peak-RSS high-water mark and the CUDA peak counter.
+
+    Returns False if the RSS mark could not be reset (no writable
+    /proc/self/clear_refs), in which case VmHWM stays the lifetime peak.
+    """
+    try:
+        # Writing 5 to clear_refs resets VmHWM to the current RSS
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        rss_reset = True
+    except OSError:
+        rss_reset = False
+    cuda = _loaded_cuda()
+    if cuda is not None:
+        cuda.reset_peak_memory_stats()
+    return rss_reset
+
+
+def peak_memory():
+    """Peak RSS and peak CUDA allocation in bytes since the last reset"""
+    peak = {"rss_bytes": _read_status_bytes("VmHWM")}
+    if peak["rss_bytes"] is None:
+        import resource
+        # Fallback without /proc: lifetime peak, reported in kB on Linux
+        peak["rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    cuda = _loaded_cuda()
+    if cuda is not None:
+        peak["cuda_bytes"] = cuda.max_memory_allocated()
+    return peak
+
+
+class PeakMemory:
+    """Context manager recording peak memory of the enclosed block in .peak.
+
+    Scopes may nest (a tiled run around its batches) or overlap across threads;
+    since each one resets the process-wide high-water mark, open scopes carry
+    forward the peak they had reached before every reset. The values are
+    process-wide: work on other threads during the block counts too. Where the
+    RSS mark cannot be reset, peak["rss_bytes"] is None rather than the
+    lifetime peak.
+    """
+
+    def __enter__(self):
+        self.peak = None
+        self._carried = {}
+        with _scopes_lock:
+            current = peak_memory()
+            for scope in _open_scopes:
+                scope._carry(current)
+            self._rss_reset = reset_peak_memory()
+            _open_scopes.append(self)
+        return self
+
+    def __exit__(self, *exc):
+        with _scopes_lock:
+            _open_scopes.remove(self)
+            self._carry(peak_memory())
+        self.peak = self._carried
+        if not self._rss_reset:
+            self.peak["rss_bytes"] = None
+        return False
+
+    def _carry(self, peak):
+        for key, value in peak.items():
+            if value is not None:
+                self._carried[key] = max(value, self._carried.get(key) or 0)
+
+
+_open_scopes = []
+_scopes_lock = threading.Lock()
+
+
+# Memory modes from fastest to leanest; each keeps the savings of the one before it
+MEMORY_MODES = {
+    "none": {"attention_slicing": False, "vae_slicing": False, "offload": False},
+    "attention_slicing": {"attention_slicing": True, "vae_slicing": False, "offload": False},
+    "vae_slicing": {"attention_slicing": True, "vae_slicing": True, "offload": False},
+    # Sequential offload keeps weights in RAM and streams each submodule to the GPU (CUDA only)
+    "offload": {"attention_slicing": True, "vae_slicing": True, "offload": True},
+}
+
+# Rough float32 activation bytes per image pixel with classifier-free guidance, for
+# the UNet (depends on attention slicing) and the VAE decoder (per image once sliced).
+# Conservative starting points; `benchmark.py memory` measures the real figures on a host.
+UNET_BYTES_PER_PIXEL = {False: 2560, True: 1024}
+VAE_BYTES_PER_PIXEL = 1536
+# VAE tiling decodes in tiles of this many pixels, so larger images stop growing its cost
+VAE_TILE_PIXELS = 512 * 512
+
+
+def resident_bytes(device):
+    """Memory the loaded model occupies now: allocated CUDA memory on GPU, process RSS on CPU"""
+    if device == "cuda":
+        import torch
+        return torch.cuda.memory_allocated()
+    return _read_status_bytes("VmRSS") or 0
+
+
+def estimate_peak_bytes(resident, size, batch_size, mode, dtype_bytes=4):
+    """Estimated peak memory of one pipeline call on top of the resident model"""
+    settings = MEMORY_MODES[mode]
+    pixels = size[0] * size[1]
+    scale = dtype_bytes / 4
+    unet = batch_size * pixels * UNET_BYTES_PER_PIXEL[settings["attention_slicing"]]
+    if settings["vae_slicing"]:
+        vae = min(pixels, VAE_TILE_PIXELS) * VAE_BYTES_PER_PIXEL
+    else:
+        vae = batch_size * pixels * VAE_BYTES_PER_PIXEL
+    return int(resident + (unet + vae) * scale)
+
+
+def choose_memory_mode(budget, resident, size, batch_size, modes=None, dtype_bytes=4):
+    """The fastest of modes whose estimated peak fits in budget, else the leanest one"""
+    modes = list(modes or MEMORY_MODES)
+    for mode in modes:
+        if estimate_peak_bytes(resident, size, batch_size, mode, dtype_bytes) <= budget:
+            return mode
+    return modes[-1]
+
+
+def apply_memory_mode(pipe, mode):
+    """Switch slicing and tiling on or off for mode; offload, once enabled, stays on"""
+    if getattr(pipe, "_memory_mode", None) == mode:
+        return
+    settings = MEMORY_MODES[mode]
+    if settings["attention_slicing"]:
+        pipe.enable_attention_slicing()
+    else:
+        pipe.disable_attention_slicing()
+    if settings["vae_slicing"]:
+        pipe.enable_vae_slicing()
+        pipe.enable_vae_tiling()
+    else:
+        pipe.disable_vae_slicing()
+        pipe.disable_vae_tiling()
+    if settings["offload"] and not getattr(pipe, "_offloaded", False):
+        pipe.enable_sequential_cpu_offload()
+        pipe._offloaded = True
+    pipe._memory_mode = mode
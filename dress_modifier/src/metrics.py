@@ -0,0 +1,209 @@
+import contextlib
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Count, sum and a window of recent samples for p50/p95/p99"""
+
+    def __init__(self, window=2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(int(q * len(ordered)), len(ordered) - 1)] for q in QUANTILES}
+
+
+class RequestTrace:
+    """Stage timings of one request, written as a JSON line when the request ends"""
+
+    def __init__(self, **fields):
+        self.fields = fields
+        self.stages = {}
+        self.started = time.perf_counter()
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+class Metrics:
+    """Process-wide stage timers, counters and the per-request trace log"""
+
+    def __init__(self, window=2048):
+        self.window = window
+        self.trace_path = None
+        self._histograms = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.window)
+            histogram.observe(value)
+
+    def count(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextlib.contextmanager
+    def timer(self, stage):
+        """Time a block as stage_seconds{stage=...}, and in the current request's trace if there is one"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_seconds", elapsed, stage=stage)
+            trace = getattr(self._local, "trace", None)
+            if trace is not None:
+                trace.add(stage, elapsed)
+
+    def annotate(self, **fields):
+        """Add fields (such as status) to the request traced on this thread, if any"""
+        trace = getattr(self._local, "trace", None)
+        if trace is not None:
+            trace.fields.update(fields)
+
+    @contextlib.contextmanager
+    def request(self, **fields):
+        """Trace one request on this thread: total latency, status and the stages timed inside it.
+
+        Memory is not measured here: the RSS high-water mark is process-wide, so
+        with concurrent requests it belongs to no single one. The pipeline records
+        pipeline_peak_rss_bytes per batch run and annotates the requests in it.
+
+        Nested calls join the outer request instead of starting a new one.
+        """
+        current = getattr(self._local, "trace", None)
+        if current is not None:
+            current.fields.update(fields)
+            yield current
+            return
+        trace = RequestTrace(**fields)
+        self._local.trace = trace
+        status = "error"
+        try:
+            yield trace
+            status = trace.fields.get("status", "ok")
+        finally:
+            self._local.trace = None
+            elapsed = time.perf_counter() - trace.started
+            self.observe("request_seconds", elapsed)
+            self.count("requests_total", status=status)
+            if self.trace_path:
+                self._write_trace(dict(trace.fields, status=status, seconds=round(elapsed, 4), time=time.time(),
+                                       stages={k: round(v, 4) for k, v in trace.stages.items()}))
+
+    def instrument_module(self, module, stage):
+        """Time every forward call of a torch module (one UNet call is one denoising step)"""
+        local = threading.local()
+
+        def before(module, args):
+            local.started = time.perf_counter()
+
+        def after(module, args, output):
+            self.observe("stage_seconds", time.perf_counter() - local.started, stage=stage)
+
+        return module.register_forward_pre_hook(before), module.register_forward_hook(after)
+
+    def render_prometheus(self, extra=None, prefix="dress_"):
+        """Prometheus text exposition of all histograms (as summaries), counters and extra gauges"""
+        with self._lock:
+            histograms = [(key, h.quantiles(), h.total, h.count) for key, h in sorted(self._histograms.items())]
+            counters = sorted(self._counters.items())
+
+        lines = []
+        typed = set()
+        for (name, labels), quantiles, total, count in histograms:
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} summary")
+                typed.add(metric)
+            for q, value in quantiles.items():
+                lines.append(f"{metric}{_labels(labels + (('quantile', q),))} {value:.6g}")
+            lines.append(f"{metric}_sum{_labels(labels)} {total:.6g}")
+            lines.append(f"{metric}_count{_labels(labels)} {count}")
+        for (name, labels), value in counters:
+            metric = prefix + name
+            if metric not in typed:
+                lines.append(f"# TYPE {metric} counter")
+                typed.add(metric)
+            lines.append(f"{metric}{_labels(labels)} {value}")
+        for name, value in sorted(_flatten(extra or {}).items()):
+            metric = prefix + name
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, extra=None, host="0.0.0.0"):
+        """Serve /metrics on its own port from a daemon thread; extra() returns gauges to include"""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render_prometheus(extra() if extra else None).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name="dress-metrics", daemon=True).start()
+        print(f"📈 Metrics on http://{host}:{port}/metrics")
+        return server
+
+    def _write_trace(self, record):
+        line = json.dumps(record) + "\n"
+        with self._lock:
+            with open(self.trace_path, "a") as f:
+                f.write(line)
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def _flatten(values, prefix=""):
+    """Numeric leaves of nested stats dicts as name_path -> value"""
+    flat = {}
+    for key, value in values.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, name + "_"))
+        elif isinstance(value, bool):
+            flat[name] = int(value)
+        elif isinstance(value, (int, float)):
+            flat[name] = value
+    return flat
+
+
+metrics = Metrics()
@@ -1,84 +1,472 @@
-import torch
-from diffusers import StableDiffusionInpaintPipeline
-from PIL import Image
-import numpy as np
-
-class DressModifier:
-    def __init__(self):
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.pipe = None
-        self.setup_model()
-    
-    def setup_model(self):
-        """Setup inpainting model for dress modification"""
-        try:
-            print("Loading stabilityai/stable-diffusion-2-inpainting...")
-            self.pipe = StableDiffusionInpaintPipeline.from_pretrained(
-                "stabilityai/stable-diffusion-2-inpainting",
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32,
-                use_safetensors=True,
-                use_auth_token=False,
-                safety_checker=None,
-                requires_safety_checker=False
-            )
-            self.pipe = self.pipe.to(self.device)
-            print("✅ Successfully loaded Stable Diffusion model")
-        except Exception as e:
-            print(f"❌ Model loading failed: {str(e)[:100]}...")
-            print("Will use fallback method for dress modification.")
-            self.pipe = None
-    
-    def modify_dress(self, image, mask, prompt):
-        """Modify dress based on user prompt"""
-        if self.pipe is None:
-            return self.fallback_modify(image, mask, prompt)
-        
-        try:
-            # Enhance prompt for better dress results
-            dress_prompt = f"beautiful {prompt}, high fashion, elegant dress, professional photography, detailed fabric texture, realistic lighting"
-            
-            result = self.pipe(
-                prompt=dress_prompt,
-                image=image,
-                mask_image=mask,
-                guidance_scale=8.0,
-                num_inference_steps=30,
-                strength=0.95,
-                negative_prompt="ugly, blurry, low quality, distorted, bad anatomy"
-            ).images[0]
-            
-            return result
-            
-        except Exception as e:
-            print(f"AI model failed: {e}")
-            return self.fallback_modify(image, mask, prompt)
-    
-    def fallback_modify(self, image, mask, prompt):
-        """Simple color/pattern change when AI fails"""
-        print("Using fallback modification...")
-        
-        # Convert to numpy
-        img_np = np.array(image)
-        mask_np = np.array(mask)
-        
-        # Simple color modification based on prompt
-        if "red" in prompt.lower():
-            color = [255, 100, 100]
-        elif "blue" in prompt.lower():
-            color = [100, 100, 255]
-        elif "green" in prompt.lower():
-            color = [100, 255, 100]
-        elif "black" in prompt.lower():
-            color = [50, 50, 50]
-        elif "white" in prompt.lower():
-            color = [240, 240, 240]
-        else:
-            color = [200, 150, 200]  # Default purple
-        
-        # Apply color to masked area
-        for i in range(3):
-            img_np[:,:,i] = np.where(mask_np > 128, 
-                                   img_np[:,:,i] * 0.3 + color[i] * 0.7, 
-                                   img_np[:,:,i])
-        
-        return Image.fromarray(img_np.astype(np.uint8))
\ No newline at end of file
+import contextlib
+import random
+import threading
+import time
+from PIL import Image
+from .cache import LRUCache
+from .registry import registry
+from .utils import prepare_crop, paste_crop
+from .tiling import inpaint_tiled
+from .fallback import recolor
+from .cpu_profile import apply_cpu_profile, bucket_for, snap_to_bucket
+from .presets import PresetSwitcher, get_preset, DEFAULT_PRESET
+from .metrics import metrics
+from . import onnx_backend
+from .memory import (PeakMemory, MEMORY_MODES, resident_bytes, estimate_peak_bytes, choose_memory_mode,
+                     apply_memory_mode)
+
+DRESS_PROMPT_TEMPLATE = "beautiful {prompt}, high fashion, elegant dress, professional photography, detailed fabric texture, realistic lighting"
+NEGATIVE_PROMPT = "ugly, blurry, low quality, distorted, bad anatomy"
+GUIDANCE_SCALE = 8.0
+STRENGTH = 0.95
+BACKENDS = ("torch", "onnx")
+
+# Approximate linear map from SD latent channels to RGB, good enough for progress previews
+LATENT_RGB_FACTORS = [
+    [0.298, 0.207, 0.208],
+    [0.187, 0.286, 0.173],
+    [-0.158, 0.189, 0.264],
+    [-0.184, -0.271, -0.473],
+]
+
+class RequestCancelled(Exception):
+    """Raised when a request is cancelled before its image is finished"""
+
+def latents_to_preview(latents):
+    """Cheap RGB preview of (1, 4, h, w) latents without running the VAE decoder"""
+    import torch
+    
+    factors = torch.tensor(LATENT_RGB_FACTORS, dtype=torch.float32, device=latents.device)
+    rgb = torch.einsum("chw,cr->hwr", latents[0].float(), factors)
+    rgb = ((rgb + 1) * 127.5).clamp(0, 255).to(torch.uint8).cpu().numpy()
+    preview = Image.fromarray(rgb)
+    return preview.resize((preview.width * 8, preview.height * 8), Image.Resampling.NEAREST)
+
+def generation_params(prompt, preset=None):
+    """Pipeline arguments derived from a user prompt and preset; needs no loaded model"""
+    settings = get_preset(preset)
+    return {
+        "prompt": DRESS_PROMPT_TEMPLATE.format(prompt=prompt),
+        "negative_prompt": NEGATIVE_PROMPT,
+        "guidance_scale": settings["guidance_scale"],
+        "num_inference_steps": settings["num_inference_steps"],
+        "strength": STRENGTH,
+        "scheduler": settings["scheduler"],
+    }
+
+def variant_seeds(seed, count):
+    """Seeds seed, seed + 1, ... for count variants; a random base when seed is None"""
+    base = seed if seed is not None else random.randrange(2 ** 31)
+    return [base + index for index in range(count)]
+
+class DressModifier:
+    def __init__(self, prompt_cache_size=256, background=False, warmup_size=256, warmup_steps=2,
+                 cpu_profile=None, cpu_threads=None, cpu_interop_threads=None, quantize=False, latent_cache_size=64,
+                 memory_budget=None, memory_mode=None, backend="torch"):
+        # Resolved by load(): importing torch takes seconds, so it happens on the loader thread
+        self.device = None
+        self.pipe = None
+        self.prompt_embeds_cache = LRUCache(prompt_cache_size)
+        self.negative_prompt_embeds = None
+        self.presets = None
+        # VAE encodes of recently seen photos, reused when only the prompt changes; 0 disables
+        self.latent_cache_size = latent_cache_size
+        self.latent_cache = None
+        
+        # CPU performance profile ("eager", "fast" or "compiled"); ignored on GPU
+        self.cpu_profile = cpu_profile
+        self.cpu_threads = cpu_threads
+        self.cpu_interop_threads = cpu_interop_threads
+        self.autocast = contextlib.nullcontext
+        self.bf16 = False
+        self.resolution_buckets = None
+        
+        # Opt-in int8 dynamic quantization of the UNet and text encoder (CPU only)
+        self.quantize = quantize
+        
+        # "torch" runs the diffusers pipeline eagerly; "onnx" runs exported graphs with ONNX Runtime on CPU
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown backend '{backend}', choose from {', '.join(BACKENDS)}")
+        self.backend = backend
+        
+        # Peak memory budget in bytes (GPU memory on CUDA, RSS on CPU): slicing, tiling and
+        # offload are switched on as needed to stay under it. memory_mode pins one mode instead.
+        self.memory_budget = memory_budget
+        self.memory_mode = memory_mode
+        self.resident_bytes = None
+        # Activations are float16 on GPU, float32 on CPU
+        self.dtype_bytes = 4
+        
+        # Warm-up runs a tiny inference after loading; set warmup_size=0 to skip it
+        self.warmup_size = warmup_size
+        self.warmup_steps = warmup_steps
+        self.status = "loading"
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self.ready = threading.Event()
+        
+        if background:
+            threading.Thread(target=self.load, name="dress-model-loader", daemon=True).start()
+        else:
+            self.load()
+    
+    @property
+    def is_ready(self):
+        return self.ready.is_set()
+    
+    def wait_until_ready(self, timeout=None):
+        """Block until loading (and warm-up) finished; returns False on timeout"""
+        return self.ready.wait(timeout)
+    
+    def load(self):
+        """Load the model, warm it up and record timings"""
+        started = time.perf_counter()
+        try:
+            self.resolve_device()
+            self.setup_model()
+            if self.pipe is not None and self.cpu_profile:
+                applied = apply_cpu_profile(self.pipe, self.cpu_profile, self.cpu_threads, self.cpu_interop_threads,
+                                            allow_bf16=not self.quantize)
+                self.autocast = applied["autocast"]
+                self.bf16 = applied["bf16"]
+                self.resolution_buckets = applied["buckets"]
+            if self.pipe is not None:
+                self.configure_memory()
+                self.instrument()
+            self.load_seconds = time.perf_counter() - started
+            print(f"⏱️ Model load took {self.load_seconds:.1f}s")
+            
+            if self.pipe is not None and self.warmup_size:
+                warmup_started = time.perf_counter()
+                try:
+                    self.warm_up()
+                    self.warmup_seconds = time.perf_counter() - warmup_started
+                    print(f"🔥 Warm-up took {self.warmup_seconds:.1f}s")
+                except Exception as e:
+                    print(f"Warm-up failed: {e}")
+            
+            self.status = "ready" if self.pipe is not None else "fallback"
+        except Exception as e:
+            # Otherwise the loader thread dies and the status stays "loading" for good
+            print(f"❌ Model setup failed: {e}")
+            print("Will use fallback method for dress modification.")
+            if self.pipe is not None:
+                registry.release(self.pipe)
+            self.pipe = None
+            self.status = "fallback"
+        finally:
+            self.ready.set()
+    
+    def resolve_device(self):
+        """Pick the device and drop the CPU-only options when running on GPU"""
+        import torch
+        
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        if self.backend == "onnx":
+            # ONNX Runtime replaces the torch CPU tuning (threads, compile, int8) and the memory modes
+            if self.cpu_profile or self.quantize or self.memory_budget or self.memory_mode:
+                print("CPU profiles, int8 quantization and memory modes apply to the torch backend only")
+            self.device = "cpu"
+            self.cpu_profile = None
+            self.quantize = False
+            self.memory_budget = None
+            self.memory_mode = None
+        elif self.device != "cpu":
+            if self.quantize:
+                print("int8 quantization is CPU-only, loading the regular pipeline")
+            self.cpu_profile = None
+            self.quantize = False
+        self.dtype_bytes = 2 if self.device == "cuda" else 4
+    
+    def configure_memory(self):
+        """Apply the pinned memory mode, or check up front whether the budget needs offload"""
+        if self.memory_mode == "offload" and self.device != "cuda":
+            # Sequential offload would hook every module onto cuda:0 and fail each call
+            print("⚠️ Memory mode 'offload' needs CUDA, ignoring it on CPU")
+            self.memory_mode = None
+        if self.memory_mode:
+            apply_memory_mode(self.pipe, self.memory_mode)
+            print(f"🧠 Memory mode: {self.memory_mode}")
+            return
+        if not self.memory_budget:
+            return
+        # The smallest run we serve, in the leanest mode that keeps the weights in place
+        leanest = estimate_peak_bytes(resident_bytes(self.device), (512, 512), 1, "vae_slicing", self.dtype_bytes)
+        if leanest > self.memory_budget:
+            if self.device == "cuda":
+                # Offload moves the weights, so it is decided once here rather than per call
+                apply_memory_mode(self.pipe, "offload")
+            else:
+                print(f"⚠️ Even a lean 512px run needs about {leanest / 1024 ** 3:.1f} GB, "
+                      f"over the {self.memory_budget / 1024 ** 3:.1f} GB budget")
+        self.resident_bytes = resident_bytes(self.device)
+        print(f"🧠 Memory budget {self.memory_budget / 1024 ** 3:.1f} GB, "
+              f"{self.resident_bytes / 1024 ** 3:.1f} GB resident after loading")
+    
+    def select_memory_mode(self, size, batch_size):
+        """Switch to the fastest memory mode whose estimate fits the budget for this call.
+
+        size must be the (width, height) the pipeline renders at, i.e. the height/width it is called with.
+        """
+        if self.memory_mode or not self.memory_budget:
+            return
+        if getattr(self.pipe, "_offloaded", False):
+            modes = ["offload"]
+        else:
+            modes = [mode for mode, settings in MEMORY_MODES.items() if not settings["offload"]]
+        apply_memory_mode(self.pipe, choose_memory_mode(self.memory_budget, self.resident_bytes, size, batch_size,
+                                                        modes, self.dtype_bytes))
+    
+    def instrument(self):
+        """Time UNet steps and VAE encode/decode with forward hooks (once per shared pipeline)"""
+        if self.backend == "onnx":
+            onnx_backend.instrument_pipeline(self.pipe)
+            return
+        if getattr(self.pipe, "_stage_hooks", None):
+            return
+        self.pipe._stage_hooks = [
+            *metrics.instrument_module(self.pipe.unet, "unet_step"),
+            *metrics.instrument_module(self.pipe.vae.encoder, "vae_encode"),
+            *metrics.instrument_module(self.pipe.vae.decoder, "vae_decode"),
+        ]
+    
+    def model_tag(self):
+        """The settings besides the request that change output pixels, for cache keys.
+        
+        None until the model is loaded, since the device decides which options
+        actually apply, and when running on the fallback.
+        """
+        if not self.is_ready or self.pipe is None:
+            return None
+        dtype = "float16" if self.device == "cuda" else "bfloat16" if self.bf16 else "float32"
+        return self.backend, "int8" if self.quantize else None, dtype, bool(self.resolution_buckets)
+    
+    def load_metrics(self):
+        """Model status and load/warm-up timings"""
+        return {
+            "status": self.status,
+            "backend": self.backend,
+            "quantized": self.quantize,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "warmup_seconds": round(self.warmup_seconds, 2) if self.warmup_seconds is not None else None,
+            "latent_cache": self.latent_cache.stats() if self.latent_cache is not None else None,
+            "memory_mode": getattr(self.pipe, "_memory_mode", None),
+            "memory_budget_bytes": self.memory_budget,
+        }
+    
+    def setup_model(self):
+        """Setup inpainting model for dress modification"""
+        try:
+            # Shared with any other entry point in this process that uses the same model
+            variant = "onnx" if self.backend == "onnx" else "int8" if self.quantize else None
+            self.pipe = registry.acquire(device=self.device, variant=variant, threads=self.cpu_threads)
+            self.presets = PresetSwitcher.for_pipe(self.pipe)
+            # The ONNX pipeline encodes the photo inside its own graph call, so there is nothing to hook
+            if self.latent_cache_size and self.backend == "torch":
+                from .latent_cache import LatentCache
+                self.latent_cache = LatentCache(self.latent_cache_size).install(self.pipe)
+            # The negative prompt never changes, so encode it exactly once
+            self.negative_prompt_embeds = self.encode_prompt(NEGATIVE_PROMPT, cache=False)
+            print("✅ Successfully loaded Stable Diffusion model")
+        except Exception as e:
+            print(f"❌ Model loading failed: {str(e)[:100]}...")
+            print("Will use fallback method for dress modification.")
+            self.pipe = None
+    
+    def close(self, unload=False):
+        """Release this modifier's reference to the shared pipeline"""
+        if self.pipe is not None:
+            registry.release(self.pipe, unload=unload)
+            self.pipe = None
+    
+    def warm_up(self):
+        """Run a small, short inference to prime allocator and kernel caches"""
+        size = self.warmup_size - self.warmup_size % 8
+        if self.resolution_buckets:
+            # Compile (or load from cache) the graph for the most common bucket up front
+            size = self.resolution_buckets[0][0]
+        image = Image.new("RGB", (size, size), (128, 128, 128))
+        mask = Image.new("L", (size, size), 255)
+        # Holds the shared pipeline like a request would, with the default scheduler
+        with self.presets.use(None):
+            if self.backend == "onnx":
+                prompt_embeds = self.encode_prompt(DRESS_PROMPT_TEMPLATE.format(prompt="dress"))
+                onnx_backend.run_batch(self.pipe, [image], [mask], [prompt_embeds], self.negative_prompt_embeds,
+                                       None, GUIDANCE_SCALE, self.warmup_steps)
+                return
+            with self.autocast():
+                self.pipe(
+                    prompt_embeds=self.encode_prompt(DRESS_PROMPT_TEMPLATE.format(prompt="dress")),
+                    negative_prompt_embeds=self.negative_prompt_embeds,
+                    image=image,
+                    mask_image=mask,
+                    height=size,
+                    width=size,
+                    guidance_scale=GUIDANCE_SCALE,
+                    num_inference_steps=self.warmup_steps,
+                    strength=STRENGTH
+                )
+    
+    def generation_params(self, prompt, preset=None):
+        """Pipeline arguments derived from a user prompt and preset (also used for cache keys)"""
+        return generation_params(prompt, preset)
+    
+    def encode_prompt(self, text, cache=True):
+        """CLIP text embedding for a prompt, reused across requests"""
+        import torch
+        
+        embeds = self.prompt_embeds_cache.get(text) if cache else None
+        if embeds is None:
+            with torch.no_grad(), metrics.timer("prompt_encode"):
+                if self.backend == "onnx":
+                    embeds = onnx_backend.encode_prompt(self.pipe, text)
+                else:
+                    embeds, _ = self.pipe.encode_prompt(text, self.device, 1, False)
+            if cache:
+                self.prompt_embeds_cache.put(text, embeds)
+        return embeds
+    
+    def make_generators(self, seeds):
+        """One torch.Generator per image, or None when no seed was requested"""
+        if seeds is None or all(seed is None for seed in seeds):
+            return None
+        import torch
+        
+        return [
+            torch.Generator(device=self.device).manual_seed(seed if seed is not None else random.randrange(2 ** 32))
+            for seed in seeds
+        ]
+    
+    def batch_key(self, size, preset=None):
+        """Images with the same key can share a pipeline call"""
+        if self.resolution_buckets:
+            size = bucket_for(size, self.resolution_buckets)
+        # One pipeline call runs one scheduler and step count
+        return size, preset or DEFAULT_PRESET
+    
+    def modify_dress(self, image, mask, prompt, seed=None, step_callback=None, preset=None, num_variants=1):
+        """Modify dress based on user prompt.
+        
+        With num_variants > 1, returns a list of images from one batched call that
+        shares the prompt encoding and image latents, seeded seed, seed + 1, ...;
+        each variant can be regenerated on its own from its seed.
+        """
+        if num_variants == 1:
+            return self.modify_dress_batch([image], [mask], [prompt], [seed], step_callback, preset)[0]
+        seeds = variant_seeds(seed, num_variants)
+        return self.modify_dress_batch([image] * num_variants, [mask] * num_variants, [prompt] * num_variants,
+                                       seeds, step_callback, preset)
+    
+    def modify_dress_cropped(self, image, mask, prompt, seed=None, padding=0.25, resolution=512, feather=8,
+                             preset=None):
+        """Inpaint only the padded mask bounding box and paste it back at the original resolution"""
+        crop_image, crop_mask, box = prepare_crop(image, mask, padding, resolution)
+        if box is None:
+            return image.copy()
+        result = self.modify_dress(crop_image, crop_mask, prompt, seed, preset=preset)
+        return paste_crop(image, result, mask, box, feather)
+    
+    def modify_dress_tiled(self, image, mask, prompt, seed=None, tile_size=512, overlap=64, batch_size=2,
+                           return_stats=False, preset=None):
+        """Inpaint a high-resolution photo in overlapping tiles with bounded peak memory"""
+        def run_batch(tiles, tile_masks):
+            return self.modify_dress_batch(tiles, tile_masks, [prompt] * len(tiles), [seed] * len(tiles),
+                                           preset=preset)
+        
+        result, stats = inpaint_tiled(image, mask, run_batch, tile_size, overlap, batch_size)
+        return (result, stats) if return_stats else result
+    
+    def modify_dress_batch(self, images, masks, prompts, seeds=None, step_callback=None, preset=None):
+        """Modify several same-sized images in a single batched pipeline call.
+        
+        preset ("draft", "standard" or "final") picks the scheduler, step count and
+        guidance for the whole batch. step_callback(step, total_steps, latents) runs
+        after every denoising step; raising RequestCancelled from it aborts the run.
+        """
+        # An unknown preset is a caller error, not a reason to fall back
+        get_preset(preset)
+        
+        # Requests that arrive while the model is loading wait here
+        self.wait_until_ready()
+        
+        if self.pipe is None:
+            return [self.fallback_modify(image, mask, prompt)
+                    for image, mask, prompt in zip(images, masks, prompts)]
+        
+        import torch
+        
+        try:
+            # Enhance prompt for better dress results
+            params = [self.generation_params(prompt, preset) for prompt in prompts]
+            
+            # Precomputed embeddings skip the text encoder for repeated prompts
+            prompt_embeds = [self.encode_prompt(p["prompt"]) for p in params]
+            
+            # Snap to a resolution bucket so compiled graphs are reused, then scale results back;
+            # the originals are kept for the fallback, which must come back at the caller's size
+            original_sizes = [image.size for image in images]
+            pipe_images, pipe_masks = images, masks
+            if self.resolution_buckets:
+                snapped = [snap_to_bucket(image, mask, self.resolution_buckets) for image, mask in zip(images, masks)]
+                pipe_images, pipe_masks = [s[0] for s in snapped], [s[1] for s in snapped]
+            # The batch shares one size; without explicit height/width the pipeline would squash it to 512x512
+            width, height = (max(side - side % 8, 8) for side in pipe_images[0].size)
+            
+            on_step_end = None
+            if step_callback is not None:
+                def on_step_end(pipe, step, timestep, callback_kwargs):
+                    step_callback(step + 1, pipe.num_timesteps, callback_kwargs["latents"])
+                    return callback_kwargs
+            
+            # Other modifiers sharing this pipeline wait, so nobody swaps its scheduler mid-denoise
+            with self.presets.use(preset) as settings:
+                # Estimate for the size the pipeline renders, which is the height/width passed below
+                self.select_memory_mode((width, height), len(pipe_images))
+                with self.autocast(), metrics.timer("pipeline"), PeakMemory() as peak:
+                    if self.backend == "onnx":
+                        results = onnx_backend.run_batch(
+                            self.pipe, pipe_images, pipe_masks, prompt_embeds, self.negative_prompt_embeds, seeds,
+                            settings["guidance_scale"], settings["num_inference_steps"], step_callback
+                        )
+                    else:
+                        results = self.pipe(
+                            prompt_embeds=torch.cat(prompt_embeds),
+                            negative_prompt_embeds=self.negative_prompt_embeds.expand(len(params), -1, -1),
+                            image=list(pipe_images),
+                            mask_image=list(pipe_masks),
+                            height=height,
+                            width=width,
+                            guidance_scale=settings["guidance_scale"],
+                            num_inference_steps=settings["num_inference_steps"],
+                            strength=STRENGTH,
+                            generator=self.make_generators(seeds),
+                            callback_on_step_end=on_step_end,
+                            callback_on_step_end_tensor_inputs=["latents"]
+                        ).images
+            
+            # Batches run one at a time, so the high-water mark since the reset belongs to this call
+            mode = getattr(self.pipe, "_memory_mode", None) or "none"
+            if peak.peak["rss_bytes"] is not None:
+                metrics.observe("pipeline_peak_rss_bytes", peak.peak["rss_bytes"], memory_mode=mode)
+            results = [result if result.size == size else result.resize(size, Image.Resampling.LANCZOS)
+                       for result, size in zip(results, original_sizes)]
+            for result in results:
+                result.info["peak_rss_bytes"] = peak.peak["rss_bytes"]
+            return results
+            
+        except RequestCancelled:
+            raise
+        except Exception as e:
+            metrics.count("errors_total", stage="pipeline")
+            print(f"AI model failed: {e}")
+            return [self.fallback_modify(image, mask, prompt)
+                    for image, mask, prompt in zip(images, masks, prompts)]
+    
+    def fallback_modify(self, image, mask, prompt):
+        """Simple color/pattern change when AI fails"""
+        print("Using fallback modification...")
+        metrics.count("fallback_total")
+        result = recolor(image, mask, prompt)
+        # Lets callers tell a recolor apart from a model output, e.g. to keep it out of the cache
+        result.info["fallback"] = True
+        return result
\ No newline at end of file
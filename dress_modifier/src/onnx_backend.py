@@ -0,0 +1,249 @@
+import os
+import shutil
+import time
+
+import numpy as np
+
+from .metrics import metrics
+
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dress_modifier", "onnx")
+ONNX_OPSET = 14
+PROVIDER = "CPUExecutionProvider"
+
+
+def _export_dir(cache_dir, model_id):
+    import torch
+    name = model_id.replace("/", "--")
+    return os.path.join(cache_dir, f"{name}-opset{ONNX_OPSET}-torch{torch.__version__.split('+')[0]}")
+
+
+def session_options(threads=None):
+    """All graph optimizations (constant folding, node fusions, layout changes), sequential execution"""
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    if threads:
+        options.intra_op_num_threads = threads
+    return options
+
+
+def _export(module, args, path, input_names, output_names, dynamic_axes, external_data=False):
+    import torch
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(module, args, path, input_names=input_names, output_names=output_names,
+                          dynamic_axes=dynamic_axes, do_constant_folding=True, opset_version=ONNX_OPSET)
+    if external_data:
+        import onnx
+
+        # Over protobuf's 2 GB limit: collapse the per-tensor files torch wrote into one weights file
+        model = onnx.load(path)
+        shutil.rmtree(os.path.dirname(path))
+        os.makedirs(os.path.dirname(path))
+        onnx.save_model(model, path, save_as_external_data=True, all_tensors_to_one_file=True,
+                        location="weights.pb", convert_attribute=False)
+
+
+def export_pipeline(pipe, output_dir):
+    """Export the text encoder, UNet and VAE encoder/decoder of a float32 inpainting pipeline to ONNX"""
+    import torch
+    from diffusers import OnnxRuntimeModel, OnnxStableDiffusionInpaintPipeline
+
+    class VaeEncoder(torch.nn.Module):
+        # The latent mean, so the graph is deterministic
+        def __init__(self, vae):
+            super().__init__()
+            self.vae = vae
+
+        def forward(self, sample):
+            return self.vae.encode(sample).latent_dist.mode()
+
+    class VaeDecoder(torch.nn.Module):
+        def __init__(self, vae):
+            super().__init__()
+            self.vae = vae
+
+        def forward(self, latent_sample):
+            return self.vae.decode(latent_sample).sample
+
+    class Unet(torch.nn.Module):
+        def __init__(self, unet):
+            super().__init__()
+            self.unet = unet
+
+        def forward(self, sample, timestep, encoder_hidden_states):
+            return self.unet(sample, timestep, encoder_hidden_states, return_dict=False)[0]
+
+    text_config = pipe.text_encoder.config
+    num_tokens, hidden_size = text_config.max_position_embeddings, text_config.hidden_size
+    sample_size = pipe.unet.config.sample_size
+    latent_channels = pipe.vae.config.latent_channels
+
+    print("Exporting text encoder to ONNX...")
+    _export(
+        pipe.text_encoder.eval(),
+        (torch.zeros(1, num_tokens, dtype=torch.int32),),
+        os.path.join(output_dir, "text_encoder", "model.onnx"),
+        ["input_ids"], ["last_hidden_state", "pooler_output"],
+        {"input_ids": {0: "batch", 1: "sequence"}}
+    )
+    print("Exporting UNet to ONNX...")
+    _export(
+        Unet(pipe.unet.eval()),
+        (torch.randn(2, pipe.unet.config.in_channels, sample_size, sample_size), torch.tensor([1.0]),
+         torch.randn(2, num_tokens, hidden_size)),
+        os.path.join(output_dir, "unet", "model.onnx"),
+        ["sample", "timestep", "encoder_hidden_states"], ["out_sample"],
+        {"sample": {0: "batch", 2: "height", 3: "width"}, "timestep": {0: "batch"},
+         "encoder_hidden_states": {0: "batch", 1: "sequence"}},
+        external_data=True
+    )
+    print("Exporting VAE to ONNX...")
+    vae = pipe.vae.eval()
+    _export(
+        VaeEncoder(vae),
+        (torch.randn(1, 3, sample_size * 8, sample_size * 8),),
+        os.path.join(output_dir, "vae_encoder", "model.onnx"),
+        ["sample"], ["latent_sample"],
+        {"sample": {0: "batch", 2: "height", 3: "width"}}
+    )
+    _export(
+        VaeDecoder(vae),
+        (torch.randn(1, latent_channels, sample_size, sample_size),),
+        os.path.join(output_dir, "vae_decoder", "model.onnx"),
+        ["latent_sample"], ["sample"],
+        {"latent_sample": {0: "batch", 2: "height", 3: "width"}}
+    )
+
+    # Tokenizer, scheduler config and model_index.json, so later loads need no torch weights
+    onnx_pipe = OnnxStableDiffusionInpaintPipeline(
+        vae_encoder=OnnxRuntimeModel.from_pretrained(os.path.join(output_dir, "vae_encoder")),
+        vae_decoder=OnnxRuntimeModel.from_pretrained(os.path.join(output_dir, "vae_decoder")),
+        text_encoder=OnnxRuntimeModel.from_pretrained(os.path.join(output_dir, "text_encoder")),
+        tokenizer=pipe.tokenizer,
+        unet=OnnxRuntimeModel.from_pretrained(os.path.join(output_dir, "unet")),
+        scheduler=pipe.scheduler,
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False
+    )
+    onnx_pipe.save_pretrained(output_dir)
+
+
+def load_onnx_pipeline(model_id, cache_dir=DEFAULT_ONNX_DIR, threads=None):
+    """ONNX Runtime inpainting pipeline on CPU, exporting the model once and reusing the saved graphs"""
+    from diffusers import OnnxStableDiffusionInpaintPipeline
+
+    path = _export_dir(cache_dir, model_id)
+    if not os.path.exists(os.path.join(path, "model_index.json")):
+        import torch
+        from diffusers import StableDiffusionInpaintPipeline
+
+        print(f"Exporting {model_id} to ONNX (one-time)...")
+        pipe = StableDiffusionInpaintPipeline.from_pretrained(
+            model_id,
+            torch_dtype=torch.float32,
+            use_safetensors=True,
+            safety_checker=None,
+            requires_safety_checker=False
+        )
+        tmp_path = f"{path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        export_pipeline(pipe, tmp_path)
+        del pipe
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    print(f"Loading ONNX pipeline from {path}")
+    return OnnxStableDiffusionInpaintPipeline.from_pretrained(path, provider=PROVIDER,
+                                                              sess_options=session_options(threads))
+
+
+class _TimedSession:
+    """An InferenceSession whose runs are recorded as a stage, like the torch forward hooks"""
+
+    def __init__(self, session, stage):
+        self.session = session
+        self.stage = stage
+
+    def run(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return self.session.run(*args, **kwargs)
+        finally:
+            metrics.observe("stage_seconds", time.perf_counter() - started, stage=self.stage)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def instrument_pipeline(pipe):
+    """Time UNet steps and VAE encode/decode (once per shared pipeline)"""
+    if getattr(pipe, "_stage_hooks", None):
+        return
+    for component, stage in (("unet", "unet_step"), ("vae_encoder", "vae_encode"), ("vae_decoder", "vae_decode")):
+        model = getattr(pipe, component)
+        model.model = _TimedSession(model.model, stage)
+    pipe._stage_hooks = ["unet", "vae_encoder", "vae_decoder"]
+
+
+def encode_prompt(pipe, text):
+    """CLIP text embedding of one prompt as a (1, tokens, dim) array"""
+    return pipe._encode_prompt(text, 1, False, None)
+
+
+def _latents(seed, size):
+    width, height = size
+    rng = np.random.RandomState(seed) if seed is not None else np.random
+    return rng.randn(1, 4, height // 8, width // 8).astype(np.float32)
+
+
+def run_batch(pipe, images, masks, prompt_embeds, negative_prompt_embeds, seeds, guidance_scale,
+              num_inference_steps, step_callback=None):
+    """Inpaint same-sized images with the ONNX pipeline, one call per distinct photo and mask.
+
+    The ONNX pipeline takes a single photo per call, so variants of one photo run
+    batched and different photos run back to back. It always denoises from pure
+    noise (strength 1.0) and draws the starting latents from numpy, seeded per
+    image, so outputs are reproducible but not pixel-identical to the torch
+    backend. step_callback(step, total_steps, latents) counts steps across all
+    calls; latents are passed only when one call covers the whole batch.
+    """
+    import torch
+
+    seeds = seeds or [None] * len(images)
+    groups = []
+    for index, (image, mask) in enumerate(zip(images, masks)):
+        if groups and images[groups[-1][0]] is image and masks[groups[-1][0]] is mask:
+            groups[-1].append(index)
+        else:
+            groups.append([index])
+
+    results = []
+    for done, group in enumerate(groups):
+        callback = None
+        if step_callback is not None:
+            def callback(step, timestep, latents, done=done):
+                total = len(pipe.scheduler.timesteps) // getattr(pipe.scheduler, "order", 1)
+                preview = torch.from_numpy(latents) if len(groups) == 1 else None
+                step_callback(done * total + step + 1, total * len(groups), preview)
+
+        width, height = images[group[0]].size
+        results.extend(pipe(
+            prompt=None,
+            image=images[group[0]],
+            mask_image=masks[group[0]],
+            height=height,
+            width=width,
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            latents=np.concatenate([_latents(seeds[index], (width, height)) for index in group]),
+            prompt_embeds=np.concatenate([prompt_embeds[index] for index in group]),
+            negative_prompt_embeds=np.repeat(negative_prompt_embeds, len(group), axis=0),
+            callback=callback,
+            callback_steps=1
+        ).images)
+    return results
@@ -0,0 +1,93 @@
+import contextlib
+import threading
+
+# Scheduler names usable in presets, with the from_config overrides they need
+SCHEDULERS = {
+    "default": None,  # Whatever the checkpoint ships with
+    "dpmpp": ("DPMSolverMultistepScheduler", {"algorithm_type": "dpmsolver++", "use_karras_sigmas": True}),
+    "unipc": ("UniPCMultistepScheduler", {}),
+    "euler_a": ("EulerAncestralDiscreteScheduler", {}),
+    "euler": ("EulerDiscreteScheduler", {}),
+    "ddim": ("DDIMScheduler", {}),
+}
+
+# Quality/latency presets; "final" reproduces the original 30-step settings
+PRESETS = {
+    "draft": {"scheduler": "dpmpp", "num_inference_steps": 10, "guidance_scale": 7.0},
+    "standard": {"scheduler": "unipc", "num_inference_steps": 20, "guidance_scale": 7.5},
+    "final": {"scheduler": "default", "num_inference_steps": 30, "guidance_scale": 8.0},
+}
+DEFAULT_PRESET = "final"
+
+# Guards creating the one switcher each shared pipeline gets
+_switchers_lock = threading.Lock()
+
+
+def get_preset(name):
+    """Preset settings by name; None means DEFAULT_PRESET"""
+    name = name or DEFAULT_PRESET
+    if name not in PRESETS:
+        raise ValueError(f"Unknown preset '{name}', choose from {', '.join(PRESETS)}")
+    return PRESETS[name]
+
+
+class PresetSwitcher:
+    """Swaps schedulers on a loaded pipeline without reloading any weights.
+
+    Scheduler objects are built once per name from the checkpoint's scheduler
+    config. Swapping mutates the pipeline, which registry.acquire shares, so
+    there is one switcher per pipeline (for_pipe) and calls hold it with use().
+    """
+
+    def __init__(self, pipe):
+        # Imported here so the preset tables stay cheap to import for argument parsers
+        import diffusers
+        self._diffusers = diffusers
+        self.pipe = pipe
+        self._schedulers = {}
+        self._lock = threading.Lock()
+        # Held for a whole pipeline call, by every modifier sharing the pipeline
+        self._call_lock = threading.Lock()
+        # The class the checkpoint was saved with, even if another user already swapped it
+        _, class_name = pipe.config["scheduler"]
+        self._default_class = getattr(diffusers, class_name)
+        self._base_config = pipe.scheduler.config
+
+    @classmethod
+    def for_pipe(cls, pipe):
+        """The pipeline's switcher, created on first use before anything swaps its scheduler"""
+        with _switchers_lock:
+            switcher = getattr(pipe, "_preset_switcher", None)
+            if switcher is None:
+                switcher = pipe._preset_switcher = cls(pipe)
+            return switcher
+
+    def scheduler(self, name):
+        with self._lock:
+            if name not in self._schedulers:
+                if name not in SCHEDULERS:
+                    raise ValueError(f"Unknown scheduler '{name}', choose from {', '.join(SCHEDULERS)}")
+                if SCHEDULERS[name] is None:
+                    cls, overrides = self._default_class, {}
+                else:
+                    class_name, overrides = SCHEDULERS[name]
+                    cls = getattr(self._diffusers, class_name)
+                self._schedulers[name] = cls.from_config(self._base_config, **overrides)
+            return self._schedulers[name]
+
+    @contextlib.contextmanager
+    def use(self, preset_name):
+        """Hold the pipeline for one call with the preset's scheduler installed; yields the preset settings"""
+        preset = get_preset(preset_name)
+        with self._call_lock:
+            self.pipe.scheduler = self.scheduler(preset["scheduler"])
+            yield preset
+
+    def apply(self, preset_name):
+        """Install the preset's scheduler on the pipeline and return the preset settings.
+
+        Only for a caller that has the pipeline to itself, such as the command line.
+        """
+        preset = get_preset(preset_name)
+        self.pipe.scheduler = self.scheduler(preset["scheduler"])
+        return preset
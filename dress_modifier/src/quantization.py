@@ -0,0 +1,86 @@
+import os
+import torch
+
+DEFAULT_QUANTIZED_DIR = os.path.join(os.path.expanduser("~"), ".cache", "dress_modifier", "quantized")
+
+# Pipeline components whose Linear layers (attention q/k/v/out projections, MLPs) are quantized
+QUANTIZED_COMPONENTS = ("unet", "text_encoder")
+
+
+def quantize_module(module):
+    """Dynamic int8 quantization of every nn.Linear; convolutions stay float32"""
+    return torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _cache_path(cache_dir, model_id, component):
+    # The packed int8 weight format belongs to the torch version that wrote it
+    name = model_id.replace("/", "--")
+    return os.path.join(cache_dir, f"{name}-{component}-int8-state-torch{torch.__version__.split('+')[0]}.pt")
+
+
+def _empty_component(model_id, component):
+    """The component's architecture from its config, with parameters on the meta device (no weights read)"""
+    from accelerate import init_empty_weights
+
+    with init_empty_weights():
+        if component == "unet":
+            from diffusers import UNet2DConditionModel
+            return UNet2DConditionModel.from_config(UNet2DConditionModel.load_config(model_id, subfolder="unet"))
+        from transformers import CLIPTextConfig, CLIPTextModel
+        return CLIPTextModel(CLIPTextConfig.from_pretrained(model_id, subfolder="text_encoder"))
+
+
+def _dynamic_linear_skeleton(module):
+    """Swap every nn.Linear for an empty int8 dynamic Linear, the layout quantize_dynamic produces"""
+    from torch.ao.nn.quantized.dynamic import Linear as DynamicLinear
+
+    for parent in list(module.modules()):
+        for name, child in list(parent.named_children()):
+            # quantize_dynamic matches the exact type, not subclasses
+            if type(child) is torch.nn.Linear:
+                setattr(parent, name, DynamicLinear(child.in_features, child.out_features,
+                                                    bias_=child.bias is not None, dtype=torch.qint8))
+    return module
+
+
+def load_quantized(model_id, cache_dir=DEFAULT_QUANTIZED_DIR):
+    """Int8 components saved by quantize_pipeline, rebuilt without loading their float32 weights.
+
+    Returns {component: module} for the ones found; pass them to from_pretrained
+    so only the remaining components are read from the checkpoint.
+    """
+    components = {}
+    for component in QUANTIZED_COMPONENTS:
+        path = _cache_path(cache_dir, model_id, component)
+        if not os.path.exists(path):
+            continue
+        print(f"Loading quantized {component} from {path}")
+        try:
+            state_dict = torch.load(path, map_location="cpu", weights_only=True)
+            module = _dynamic_linear_skeleton(_empty_component(model_id, component))
+            # assign=True replaces the meta parameters with the loaded tensors instead of copying into them
+            module.load_state_dict(state_dict, assign=True)
+        except Exception as e:
+            print(f"Ignoring quantized {component} at {path}: {e}")
+            continue
+        components[component] = module.eval()
+    return components
+
+
+def quantize_pipeline(pipe, model_id, cache_dir=DEFAULT_QUANTIZED_DIR, loaded=()):
+    """Swap the UNet and text encoder for int8 versions and save each state_dict for load_quantized.
+
+    Components in loaded already came from load_quantized and are left as they are.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    for component in QUANTIZED_COMPONENTS:
+        if component in loaded:
+            continue
+        print(f"Quantizing {component} to int8 (one-time)...")
+        quantized = quantize_module(getattr(pipe, component).eval())
+        path = _cache_path(cache_dir, model_id, component)
+        tmp_path = f"{path}.tmp"
+        torch.save(quantized.state_dict(), tmp_path)
+        os.replace(tmp_path, path)
+        setattr(pipe, component, quantized)
+    return pipe
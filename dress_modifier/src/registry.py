@@ -0,0 +1,133 @@
+import threading
+
+DEFAULT_MODEL_ID = "stabilityai/stable-diffusion-2-inpainting"
+
+
+def default_device():
+    import torch
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+
+def default_dtype(device):
+    import torch
+    return torch.float16 if device == "cuda" else torch.float32
+
+
+class PipelineRegistry:
+    """Process-wide inpainting pipelines, loaded once per (model id, dtype, device, variant) and refcounted.
+    
+    variant=None is the plain pipeline; "int8" has a dynamic-quantized UNet and text encoder (CPU only);
+    "onnx" runs exported ONNX graphs with ONNX Runtime (CPU only).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(model_id=DEFAULT_MODEL_ID, dtype=None, device=None, variant=None):
+        device = device or default_device()
+        dtype = dtype or default_dtype(device)
+        return (model_id, str(dtype).replace("torch.", ""), device, variant or "default")
+
+    def acquire(self, model_id=DEFAULT_MODEL_ID, dtype=None, device=None, variant=None, threads=None):
+        """Return the shared pipeline for these settings, loading it on first use.
+        
+        threads sizes ONNX Runtime's intra-op pool for the "onnx" variant; torch
+        threads are process-wide and set by the CPU profile instead.
+        """
+        device = device or default_device()
+        dtype = dtype or default_dtype(device)
+        key = self.make_key(model_id, dtype, device, variant)
+
+        # One lock per key: concurrent callers for the same model wait for a single load
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["refs"] += 1
+                    return entry["pipe"]
+
+            pipe = self._load(model_id, dtype, device, variant, threads)
+            with self._lock:
+                self._entries[key] = {"pipe": pipe, "refs": 1}
+            return pipe
+
+    def register(self, pipe, model_id=DEFAULT_MODEL_ID, dtype=None, device=None, variant=None):
+        """Serve an already built pipeline (e.g. a benchmark stub) for these settings instead of loading one"""
+        key = self.make_key(model_id, dtype, device, variant)
+        with self._lock:
+            self._entries[key] = {"pipe": pipe, "refs": 0}
+        return pipe
+
+    def release(self, pipe, unload=False):
+        """Drop one reference; with unload=True the pipeline is freed once nobody holds it"""
+        with self._lock:
+            for key, entry in self._entries.items():
+                if entry["pipe"] is pipe:
+                    entry["refs"] = max(entry["refs"] - 1, 0)
+                    if unload and entry["refs"] == 0:
+                        del self._entries[key]
+                        self._free()
+                    return
+
+    def unload(self, model_id=DEFAULT_MODEL_ID, dtype=None, device=None, variant=None, force=False):
+        """Explicitly free a pipeline; refuses while references are held unless force=True"""
+        key = self.make_key(model_id, dtype, device, variant)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False
+            if entry["refs"] > 0 and not force:
+                return False
+            del self._entries[key]
+        self._free()
+        return True
+
+    def loaded(self):
+        """Currently loaded pipelines and their reference counts"""
+        with self._lock:
+            return {"/".join(key): entry["refs"] for key, entry in self._entries.items()}
+
+    def _load(self, model_id, dtype, device, variant=None, threads=None):
+        if variant == "onnx":
+            from .onnx_backend import load_onnx_pipeline
+            
+            if device != "cpu":
+                raise ValueError("The ONNX Runtime backend is only supported on CPU")
+            return load_onnx_pipeline(model_id, threads=threads)
+        
+        from diffusers import StableDiffusionInpaintPipeline
+        from .quantization import load_quantized, quantize_pipeline
+        
+        if variant == "int8" and device != "cpu":
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+        print(f"Loading {model_id} ({dtype}, {device}, {variant or 'default'})...")
+        # Int8 components quantized on an earlier start replace their float32 weights, which are then never read
+        quantized = load_quantized(model_id) if variant == "int8" else {}
+        # safetensors are memory-mapped; with low_cpu_mem_usage the CPU parameters keep pointing
+        # at the mapped file, so other processes loading the same weights share the page cache
+        pipe = StableDiffusionInpaintPipeline.from_pretrained(
+            model_id,
+            torch_dtype=dtype,
+            use_safetensors=True,
+            low_cpu_mem_usage=True,
+            safety_checker=None,
+            requires_safety_checker=False,
+            **quantized
+        )
+        if variant == "int8":
+            pipe = quantize_pipeline(pipe, model_id, loaded=quantized)
+        return pipe.to(device)
+
+    def _free(self):
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+
+registry = PipelineRegistry()
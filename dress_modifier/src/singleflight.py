@@ -0,0 +1,99 @@
+import threading
+from concurrent.futures import Future, TimeoutError
+
+from .model import RequestCancelled
+
+
+class _Flight:
+    """One running computation and the progress callbacks of everyone waiting on it"""
+
+    def __init__(self):
+        self.future = Future()
+        self.listeners = []
+        self.lock = threading.Lock()
+
+    def progress(self, *args):
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(*args)
+            except Exception as e:
+                print(f"Progress callback failed: {e}")
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls: the first caller for a key runs it, the rest wait for its result.
+
+    Only calls that overlap in time are shared; once a result is returned the
+    key is forgotten (the result cache covers later repeats).
+    """
+
+    def __init__(self, poll_interval=0.25):
+        self.poll_interval = poll_interval
+        self._flights = {}
+        self._lock = threading.Lock()
+        self._counters = {"runs": 0, "saved_runs": 0, "leader_cancelled": 0}
+
+    def do(self, key, fn, progress=None, cancel_event=None):
+        """Return (fn(progress)'s result, shared) for key, running fn only if no identical call is in flight.
+
+        Waiting callers get the running call's step progress and can still cancel
+        on their own. If the running call is cancelled by its caller, the waiters
+        start over and one of them runs it instead.
+        """
+        while True:
+            with self._lock:
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                    self._counters["runs"] += 1
+                if progress is not None:
+                    with flight.lock:
+                        flight.listeners.append(progress)
+
+            if leader:
+                return self._lead(key, flight, fn), False
+            try:
+                result = self._wait(flight, cancel_event)
+            except RequestCancelled:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise
+                # The caller running it cancelled; someone still wants the result
+                with self._lock:
+                    self._counters["leader_cancelled"] += 1
+                continue
+            finally:
+                if progress is not None:
+                    with flight.lock:
+                        flight.listeners.remove(progress)
+            with self._lock:
+                self._counters["saved_runs"] += 1
+            return result, True
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._flights))
+
+    def _lead(self, key, flight, fn):
+        try:
+            result = fn(flight.progress)
+        except BaseException as e:
+            flight.future.set_exception(e)
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._flights[key]
+
+    def _wait(self, flight, cancel_event):
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelled("Request was cancelled")
+            try:
+                return flight.future.result(timeout=self.poll_interval)
+            except TimeoutError:
+                continue
@@ -0,0 +1,144 @@
+import json
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+import torch
+from PIL import Image
+
+
+class _StubVAE(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.encoder = torch.nn.Identity()
+        self.decoder = torch.nn.Identity()
+        self.config = SimpleNamespace(scaling_factor=0.18215)
+
+
+class StubInpaintPipeline:
+    """Deterministic, weight-free stand-in for StableDiffusionInpaintPipeline.
+
+    Accepts the same call arguments DressModifier passes, fires the step
+    callback and module hooks like the real pipeline, and returns the input
+    with the masked area blended towards a fixed colour. step_seconds adds a
+    fixed per-step cost so batching and throughput behave like a real model.
+    """
+
+    def __init__(self, step_seconds=0.0, embed_dim=1024):
+        from diffusers import PNDMScheduler
+
+        self.step_seconds = step_seconds
+        self.embed_dim = embed_dim
+        self.scheduler = PNDMScheduler(skip_prk_steps=True)
+        self.config = {"scheduler": ("diffusers", "PNDMScheduler")}
+        self.unet = torch.nn.Identity()
+        self.unet.config = SimpleNamespace(sample_size=64)
+        self.vae = _StubVAE()
+        self.num_timesteps = 0
+
+    def encode_prompt(self, prompt, device, num_images_per_prompt, do_classifier_free_guidance, *args, **kwargs):
+        generator = torch.Generator().manual_seed(sum(prompt.encode()) % 2 ** 31)
+        embeds = torch.randn((num_images_per_prompt, 77, self.embed_dim), generator=generator)
+        return embeds, None
+
+    def _encode_vae_image(self, image, generator):
+        return self.vae.encoder(image)
+
+    def __call__(self, prompt_embeds=None, image=None, mask_image=None, num_inference_steps=30, strength=1.0,
+                 height=None, width=None, callback_on_step_end=None, **kwargs):
+        images = image if isinstance(image, list) else [image]
+        masks = mask_image if isinstance(mask_image, list) else [mask_image]
+        # Like the real pipeline: without height/width every input is resized to sample_size * 8
+        # (512x512 for SD2), and steps are scaled by strength
+        height = height or self.unet.config.sample_size * 8
+        width = width or self.unet.config.sample_size * 8
+        if height % 8 or width % 8:
+            raise ValueError(f"`height` and `width` have to be divisible by 8 but are {height} and {width}.")
+        latents = torch.zeros((len(images), 4, height // 8, width // 8))
+        self.num_timesteps = max(int(num_inference_steps * strength), 1)
+
+        for step in range(self.num_timesteps):
+            latents = self.unet(latents)
+            if self.step_seconds:
+                time.sleep(self.step_seconds)
+            if callback_on_step_end is not None:
+                callback_on_step_end(self, step, step, {"latents": latents})
+        self.vae.decoder(latents)
+
+        results = []
+        for source, mask in zip(images, masks):
+            source = source.convert("RGB").resize((width, height))
+            mask = mask.convert("L").resize((width, height), Image.Resampling.NEAREST)
+            colour = Image.blend(source, Image.new("RGB", source.size, (200, 150, 200)), 0.6)
+            results.append(Image.composite(colour, source, mask))
+        return SimpleNamespace(images=results)
+
+
+def _tiny_tokenizer():
+    """A character-level CLIP tokenizer built from a generated vocabulary, no download needed"""
+    from transformers import CLIPTokenizer
+
+    vocab = {"<|startoftext|>": 0, "<|endoftext|>": 2}
+    for code in range(33, 127):
+        vocab[chr(code)] = len(vocab) + 1
+        vocab[chr(code) + "</w>"] = len(vocab) + 1
+    with tempfile.TemporaryDirectory() as folder:
+        vocab_file = os.path.join(folder, "vocab.json")
+        merges_file = os.path.join(folder, "merges.txt")
+        with open(vocab_file, "w") as f:
+            json.dump(vocab, f)
+        with open(merges_file, "w") as f:
+            f.write("#version: 0.2\n")
+        return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+
+def tiny_inpaint_pipeline(seed=0):
+    """Randomly initialised SD2-style inpainting pipeline (9-channel UNet, 8x VAE), small enough to build in seconds"""
+    from diffusers import AutoencoderKL, PNDMScheduler, StableDiffusionInpaintPipeline, UNet2DConditionModel
+    from transformers import CLIPTextConfig, CLIPTextModel
+
+    torch.manual_seed(seed)
+    unet = UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        sample_size=64,
+        in_channels=9,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        cross_attention_dim=32,
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+    )
+    vae = AutoencoderKL(
+        block_out_channels=(32, 32, 32, 32),
+        in_channels=3,
+        out_channels=3,
+        down_block_types=("DownEncoderBlock2D",) * 4,
+        up_block_types=("UpDecoderBlock2D",) * 4,
+        latent_channels=4,
+        layers_per_block=1,
+    )
+    text_encoder = CLIPTextModel(CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=2,
+        pad_token_id=1,
+        hidden_size=32,
+        intermediate_size=37,
+        num_attention_heads=4,
+        num_hidden_layers=2,
+        vocab_size=1000,
+    ))
+    pipe = StableDiffusionInpaintPipeline(
+        vae=vae.eval(),
+        text_encoder=text_encoder.eval(),
+        tokenizer=_tiny_tokenizer(),
+        unet=unet.eval(),
+        scheduler=PNDMScheduler(skip_prk_steps=True),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False,
+    )
+    pipe.set_progress_bar_config(disable=True)
+    return pipe
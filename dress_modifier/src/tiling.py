@@ -0,0 +1,90 @@
+import numpy as np
+from PIL import Image
+
+from .mask import CompactMask
+from .memory import PeakMemory
+
+
+def _tile_starts(length, tile, stride):
+    """Tile offsets along one axis; the last tile is aligned to the far edge"""
+    if length <= tile:
+        return [0]
+    starts = list(range(0, length - tile, stride))
+    starts.append(length - tile)
+    return starts
+
+
+def tile_boxes(size, tile_size=512, overlap=64):
+    """Overlapping (left, top, right, bottom) boxes covering an image in raster order"""
+    width, height = size
+    tile_w, tile_h = min(tile_size, width), min(tile_size, height)
+    stride = max(tile_size - overlap, 8)
+    return [
+        (left, top, left + tile_w, top + tile_h)
+        for top in _tile_starts(height, tile_h, stride)
+        for left in _tile_starts(width, tile_w, stride)
+    ]
+
+
+def _overlaps(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def blend_ramp(box, done_boxes, overlap):
+    """Per-pixel weight that fades a tile in over edges shared with already-blended tiles"""
+    width, height = box[2] - box[0], box[3] - box[1]
+    ramp_x = np.ones(width, dtype=np.float32)
+    ramp_y = np.ones(height, dtype=np.float32)
+    for done in done_boxes:
+        if done[3] <= box[1] or done[1] >= box[3] or done[2] <= box[0] or done[0] >= box[2]:
+            continue
+        if done[0] < box[0] < done[2]:
+            span = min(done[2] - box[0], overlap, width)
+            ramp_x[:span] = np.minimum(ramp_x[:span], np.linspace(0, 1, span + 2, dtype=np.float32)[1:-1])
+        if done[1] < box[1] < done[3]:
+            span = min(done[3] - box[1], overlap, height)
+            ramp_y[:span] = np.minimum(ramp_y[:span], np.linspace(0, 1, span + 2, dtype=np.float32)[1:-1])
+    return ramp_y[:, None] * ramp_x[None, :]
+
+
+def inpaint_tiled(image, mask, run_batch, tile_size=512, overlap=64, batch_size=2):
+    """Inpaint a large image tile by tile.
+
+    run_batch(images, masks) must return one inpainted image per tile. Tiles
+    without mask pixels are skipped, and each result is blended straight into
+    the output, so memory stays at one uint8 copy of the image plus a batch of tiles.
+    Returns the output image and a stats dict including peak memory.
+    """
+    if mask.size != image.size:
+        mask = mask.resize(image.size, Image.Resampling.NEAREST)
+    mask = mask.convert('L')
+    mask_np = np.asarray(mask)
+
+    # Same bounding box as crop mode; only tiles overlapping it are checked for mask pixels
+    bbox = CompactMask.from_image(mask).bbox
+    boxes = tile_boxes(image.size, tile_size, overlap)
+    todo = [box for box in boxes if bbox is not None and _overlaps(box, bbox)
+            and (mask_np[box[1]:box[3], box[0]:box[2]] > 128).any()]
+
+    output = np.array(image.convert('RGB'))
+    done = []
+    with PeakMemory() as peak:
+        for start in range(0, len(todo), batch_size):
+            batch = todo[start:start + batch_size]
+            tiles = [image.crop(box).convert('RGB') for box in batch]
+            tile_masks = [mask.crop(box) for box in batch]
+            results = run_batch(tiles, tile_masks)
+
+            for box, tile, result in zip(batch, tiles, results):
+                if result.size != tile.size:
+                    result = result.resize(tile.size, Image.Resampling.LANCZOS)
+                # Only masked pixels change; overlaps fade from the previous tile into this one
+                alpha = blend_ramp(box, done, overlap) * (mask_np[box[1]:box[3], box[0]:box[2]] > 128)
+                region = output[box[1]:box[3], box[0]:box[2]]
+                blended = region + (np.asarray(result.convert('RGB'), dtype=np.float32) - region) * alpha[..., None]
+                region[...] = np.clip(blended + 0.5, 0, 255).astype(np.uint8)
+                done.append(box)
+
+    stats = {"tiles": len(boxes), "inpainted": len(todo), "skipped": len(boxes) - len(todo)}
+    stats.update(peak.peak)
+    return Image.fromarray(output), stats
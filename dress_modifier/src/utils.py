@@ -1,14 +1,91 @@
-from PIL import Image
-import numpy as np
-
-def resize_image(image, max_size=512):
-    """Resize image to prevent memory issues while maintaining aspect ratio"""
-    if max(image.size) > max_size:
-        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-    return image
-
-def mask_to_pil(mask_data):
-    """Convert Gradio mask data to PIL Image"""
-    if isinstance(mask_data, dict) and 'mask' in mask_data:
-        return Image.fromarray(mask_data['mask']).convert('L')
-    return mask_data
\ No newline at end of file
+import io
+from PIL import Image, ImageFilter
+from .mask import CompactMask, editor_mask
+
+# Media types of the output formats results can be encoded in
+OUTPUT_FORMATS = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+
+def resize_image(image, max_size=512, multiple=8):
+    """Fit image within max_size keeping its aspect ratio, with both sides a multiple of 8.
+
+    DressModifier renders at this size by passing it as the pipeline's
+    height/width. Returns a new image when anything changes; the caller's
+    image is never modified.
+    """
+    width, height = image.size
+    scale = min(max_size / max(width, height), 1.0)
+    size = (max(int(width * scale) // multiple * multiple, multiple),
+            max(int(height * scale) // multiple * multiple, multiple))
+    if size == image.size:
+        return image
+    # reducing_gap shrinks by an integer factor first, then LANCZOS only on the last ~3x
+    return image.resize(size, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+def load_image(source, mode='RGB', max_size=None):
+    """Open a path, file or bytes as a loaded image in mode, downscaled to max_size if given.
+
+    Large JPEGs are decoded straight at 1/2, 1/4 or 1/8 scale, which skips most
+    of the decoding work for pixels resize_image would throw away.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as image:
+        if max_size and image.format == 'JPEG':
+            image.draft(mode, (max_size, max_size))
+        image = image.convert(mode)
+    return resize_image(image, max_size) if max_size else image
+
+def encode_image(image, format='WEBP', quality=90):
+    """Compressed bytes of image in one of OUTPUT_FORMATS (quality is ignored for PNG)"""
+    format = format.upper()
+    options = {'PNG': {}, 'JPEG': {'quality': quality, 'optimize': True}, 'WEBP': {'quality': quality, 'method': 4}}
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format=format, **options[format])
+    return buffer.getvalue()
+
+def mask_to_pil(mask_data):
+    """Convert Gradio mask data to PIL Image"""
+    return Image.fromarray(editor_mask(mask_data))
+
+def expand_box(box, image_size, padding=0.25, min_size=64):
+    """Grow a box by a fraction of its size for context, clamped to the image"""
+    left, top, right, bottom = box
+    width, height = image_size
+    pad_x = max(int((right - left) * padding), (min_size - (right - left)) // 2, 0)
+    pad_y = max(int((bottom - top) * padding), (min_size - (bottom - top)) // 2, 0)
+    return (max(left - pad_x, 0), max(top - pad_y, 0),
+            min(right + pad_x, width), min(bottom + pad_y, height))
+
+def prepare_crop(image, mask, padding=0.25, resolution=512):
+    """Crop image and mask around the masked area and scale the crop to model resolution"""
+    if mask.size != image.size:
+        mask = mask.resize(image.size, Image.Resampling.NEAREST)
+    
+    bbox = CompactMask.from_image(mask).bbox
+    if bbox is None:
+        return None, None, None
+    box = expand_box(bbox, image.size, padding)
+    
+    # Long side at model resolution, both sides a multiple of 8 as the UNet requires
+    crop_w, crop_h = box[2] - box[0], box[3] - box[1]
+    scale = resolution / max(crop_w, crop_h)
+    size = (max(8, round(crop_w * scale / 8) * 8), max(8, round(crop_h * scale / 8) * 8))
+    
+    crop_image = image.crop(box).resize(size, Image.Resampling.LANCZOS)
+    crop_mask = mask.crop(box).convert('L').resize(size, Image.Resampling.NEAREST)
+    return crop_image, crop_mask, box
+
+def paste_crop(original, result, mask, box, feather=8):
+    """Blend an inpainted crop back into the full-resolution original with a feathered seam"""
+    if mask.size != original.size:
+        mask = mask.resize(original.size, Image.Resampling.NEAREST)
+    
+    crop_size = (box[2] - box[0], box[3] - box[1])
+    patch = result.convert(original.mode).resize(crop_size, Image.Resampling.LANCZOS)
+    alpha = mask.crop(box).convert('L')
+    if feather:
+        alpha = alpha.filter(ImageFilter.GaussianBlur(feather))
+    
+    output = original.copy()
+    output.paste(patch, box[:2], alpha)
+    return output
@@ -0,0 +1,429 @@
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+# Nothing here imports torch at module level: spawned workers set their thread
+# budget and CPU affinity before torch (and its OpenMP pool) is loaded
+
+
+def core_slices(num_workers, cores=None):
+    """Split the usable cores into num_workers disjoint, equally sized sets"""
+    if cores is None:
+        cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count()))
+    per_worker = max(len(cores) // num_workers, 1)
+    return [cores[i * per_worker:(i + 1) * per_worker] or cores[:per_worker] for i in range(num_workers)]
+
+
+def _write_shared(image, mask):
+    """Copy image pixels and the bit-packed mask into a new shared-memory block; returns (block, image size, mask size)"""
+    from .mask import CompactMask
+
+    image = image.convert("RGB")
+    mask = CompactMask.from_image(mask)
+    image_bytes = image.width * image.height * 3
+    block = shared_memory.SharedMemory(create=True, size=image_bytes + mask.nbytes)
+    block.buf[:image_bytes] = image.tobytes()
+    block.buf[image_bytes:image_bytes + mask.nbytes] = mask.bits
+    return block, image.size, mask.size
+
+
+def _read_image(block, mode, size, offset=0):
+    length = size[0] * size[1] * len(mode)
+    # frombytes copies straight out of the shared buffer, no intermediate bytes object
+    return Image.frombytes(mode, size, block.buf[offset:offset + length])
+
+
+def _read_mask(block, size, offset):
+    from .mask import CompactMask
+
+    length = (size[0] + 7) // 8 * size[1]
+    return CompactMask(block.buf[offset:offset + length], size).to_image()
+
+
+def _worker_main(worker_id, cores, options, requests, responses):
+    """Worker process: one DressModifier and batch scheduler on a pinned set of cores"""
+    threads = len(cores)
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+        os.environ[name] = str(threads)
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+
+    from .batching import BatchScheduler
+    from .cpu_profile import configure_threads
+    from .model import DressModifier, RequestCancelled
+
+    configure_threads(threads)
+    # Each worker maps the same safetensors files, so the weights sit in the page cache once
+    modifier = DressModifier(cpu_threads=threads, **options["model"])
+    scheduler = BatchScheduler(modifier, **options["batching"])
+    responses.put(("ready", worker_id, dict(modifier.load_metrics(), pid=os.getpid(), threads=threads,
+                                            model_tag=modifier.model_tag())))
+
+    cancel_events = {}
+
+    def finish(job_id, block, future):
+        cancel_events.pop(job_id, None)
+        try:
+            result = future.result().convert("RGB")
+            # Results come back at the input size, so they fit in the request's block; check anyway,
+            # since an overflow here would leave the parent waiting for a response that never comes
+            if result.width * result.height * 3 > block.size:
+                raise RuntimeError(f"Result {result.size} does not fit the request's shared memory")
+            block.buf[:result.width * result.height * 3] = result.tobytes()
+        except RequestCancelled:
+            responses.put(("cancelled", job_id))
+        except Exception as e:
+            responses.put(("error", job_id, str(e)))
+        else:
+            responses.put(("done", job_id, result.size, result.info.get("peak_rss_bytes"),
+                           result.info.get("fallback", False)))
+        finally:
+            block.close()
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        if message[0] == "cancel":
+            event = cancel_events.get(message[1])
+            if event is not None:
+                event.set()
+            continue
+
+        _, job_id, block_name, image_size, mask_size, prompt, seed, preset = message
+        try:
+            block = shared_memory.SharedMemory(name=block_name)
+        except FileNotFoundError:
+            # The parent already gave up on this job (timed out) and freed its block
+            continue
+        image = _read_image(block, "RGB", image_size)
+        mask = _read_mask(block, mask_size, offset=image_size[0] * image_size[1] * 3)
+        cancel_events[job_id] = threading.Event()
+        future = scheduler.submit(
+            image, mask, prompt, seed,
+            progress=lambda step, total, latents, job_id=job_id: responses.put(("progress", job_id, step, total)),
+            cancel_event=cancel_events[job_id],
+            preset=preset
+        )
+        future.add_done_callback(lambda f, job_id=job_id, block=block: finish(job_id, block, f))
+
+    scheduler.close()
+    modifier.close()
+
+
+class _Job:
+    """A request dispatched to a worker, waiting for its response"""
+
+    def __init__(self, worker, block, progress, cancel_event, deadline=None):
+        self.worker = worker
+        self.deadline = deadline
+        self.block = block
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.cancel_sent = False
+        self.future = Future()
+
+
+class _Worker:
+    def __init__(self, worker_id, process, requests, cores):
+        self.worker_id = worker_id
+        self.process = process
+        self.requests = requests
+        self.cores = cores
+        self.metrics = None
+        self.in_flight = 0
+        self.completed = 0
+
+
+class WorkerPool:
+    """Runs N model-holding worker processes and routes each request to the least-loaded one.
+
+    Exposes the same submit/modify_dress/stats/close interface as BatchScheduler,
+    plus the status methods the app reads from DressModifier. Image and mask
+    pixels travel through shared memory; only small messages are pickled.
+    """
+
+    def __init__(self, num_workers=2, cores_per_worker=None, max_batch_size=4, max_wait=0.05,
+                 cpu_profile=None, quantize=False, warmup_size=256, memory_budget=None, memory_mode=None,
+                 backend="torch", job_timeout=600):
+        cores = core_slices(num_workers)
+        if cores_per_worker:
+            cores = [c[:cores_per_worker] for c in cores]
+        options = {
+            "model": {"cpu_profile": cpu_profile, "quantize": quantize, "warmup_size": warmup_size,
+                      "memory_budget": memory_budget, "memory_mode": memory_mode, "backend": backend},
+            "batching": {"max_batch_size": max_batch_size, "max_wait": max_wait},
+        }
+        # Enough requests in flight to fill a batch on every worker
+        self.max_batch_size = max_batch_size * num_workers
+        # Seconds before a job with no response from its worker is failed (None waits forever)
+        self.job_timeout = job_timeout
+
+        context = multiprocessing.get_context("spawn")
+        self._responses = context.Queue()
+        self._workers = []
+        for worker_id, worker_cores in enumerate(cores):
+            requests = context.Queue()
+            process = context.Process(
+                target=_worker_main, args=(worker_id, worker_cores, options, requests, self._responses),
+                name=f"dress-worker-{worker_id}", daemon=True
+            )
+            process.start()
+            self._workers.append(_Worker(worker_id, process, requests, worker_cores))
+            print(f"🚀 Started worker {worker_id} (pid {process.pid}) on cores {worker_cores}")
+
+        self._jobs = {}
+        self._job_ids = itertools.count()
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._closed = False
+        self._all_dead_reported = False
+        self._started = time.monotonic()
+        self._counters = {"requests": 0, "cancelled": 0, "failed": 0}
+
+        self._listener = threading.Thread(target=self._listen, name="dress-router", daemon=True)
+        self._listener.start()
+
+    def submit(self, image, mask, prompt, seed=None, progress=None, cancel_event=None, preset=None):
+        """Send a request to the least-loaded worker and return a Future resolving to the modified image.
+
+        progress(step, total_steps, None) receives step counts; latents stay in the worker.
+        """
+        return self._submit(image, mask, prompt, [seed], progress, cancel_event, preset)[0]
+
+    def submit_variants(self, image, mask, prompt, seeds, progress=None, cancel_event=None, preset=None):
+        """One Future per seed; all go to the same worker, whose scheduler batches them into one call"""
+        return self._submit(image, mask, prompt, seeds, progress, cancel_event, preset)
+
+    def _submit(self, image, mask, prompt, seeds, progress, cancel_event, preset):
+        with self._lock:
+            closed, alive = self._closed, any(w.process.is_alive() for w in self._workers)
+        if not alive and not closed:
+            # Every worker exited: recolor in-process, as DressModifier does without a pipeline
+            return [_fallback_future(image, mask, prompt) for _ in seeds]
+        # Each job owns a block, since its result is written back into it
+        blocks = [_write_shared(image, mask) for _ in seeds]
+        with self._lock:
+            alive = [w for w in self._workers if w.process.is_alive()]
+            if self._closed or not alive:
+                for block, _, _ in blocks:
+                    block.close()
+                    block.unlink()
+                raise RuntimeError("Worker pool is closed" if self._closed else "No worker process is alive")
+            # Skip dead workers; prefer those that finished loading, then the fewest requests in flight
+            worker = min(alive, key=lambda w: (w.metrics is None, w.in_flight, w.worker_id))
+            worker.in_flight += len(seeds)
+            deadline = time.monotonic() + self.job_timeout if self.job_timeout else None
+            messages, futures = [], []
+            for seed, (block, image_size, mask_size) in zip(seeds, blocks):
+                job_id = next(self._job_ids)
+                # Step counts of the first variant stand for the whole request
+                job = _Job(worker, block, progress if not futures else None, cancel_event, deadline)
+                self._jobs[job_id] = job
+                messages.append(("run", job_id, block.name, image_size, mask_size, prompt, seed, preset))
+                futures.append(job.future)
+        for message in messages:
+            worker.requests.put(message)
+        return futures
+
+    def modify_dress(self, image, mask, prompt, seed=None, timeout=None, progress=None, cancel_event=None,
+                     preset=None):
+        """Blocking drop-in replacement for DressModifier.modify_dress"""
+        return self.submit(image, mask, prompt, seed, progress, cancel_event, preset).result(timeout)
+
+    def generation_params(self, prompt, preset=None):
+        """Same pipeline arguments the workers use, for cache keys"""
+        from .model import generation_params
+        return generation_params(prompt, preset)
+
+    @property
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        """Block until every worker has loaded its model; returns False on timeout"""
+        return self._ready.wait(timeout)
+
+    def model_tag(self):
+        """The live workers' shared model tag for cache keys; None while loading or if they differ"""
+        with self._lock:
+            tags = {w.metrics.get("model_tag") if w.metrics else None
+                    for w in self._workers if w.process.is_alive()}
+        return tags.pop() if len(tags) == 1 else None
+
+    def load_metrics(self):
+        """Combined model status: ready only when every live worker loaded the real pipeline.
+
+        Once no worker is alive the status is "fallback" and requests are recolored in-process.
+        """
+        with self._lock:
+            metrics = [w.metrics for w in self._workers]
+            live = [w.metrics for w in self._workers if w.process.is_alive()]
+        if any(m is None for m in metrics):
+            status = "loading"
+        elif live and all(m["status"] == "ready" for m in live):
+            status = "ready"
+        else:
+            status = "fallback"
+        loaded = [m["load_seconds"] for m in metrics if m and m["load_seconds"] is not None]
+        return {
+            "status": status,
+            "workers": len(metrics),
+            "load_seconds": max(loaded) if loaded else None,
+        }
+
+    def stats(self):
+        """Per-worker load and pool-wide throughput"""
+        with self._lock:
+            workers = [{
+                "worker": w.worker_id,
+                "pid": w.process.pid,
+                "alive": w.process.is_alive(),
+                "cores": len(w.cores),
+                "in_flight": w.in_flight,
+                "completed": w.completed,
+                "status": w.metrics["status"] if w.metrics else "loading",
+            } for w in self._workers]
+            elapsed = time.monotonic() - self._started
+            return dict(
+                self._counters,
+                queue_depth=len(self._jobs),
+                images_per_second=round(self._counters["requests"] / elapsed, 3) if elapsed else 0.0,
+                workers=workers,
+            )
+
+    def close(self):
+        """Stop the workers after they finish the requests already sent to them"""
+        with self._lock:
+            self._closed = True
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join()
+        self._listener.join()
+
+    def _listen(self):
+        """Route worker responses to their futures, forward cancellations and notice dead workers"""
+        while True:
+            try:
+                message = self._responses.get(timeout=0.1)
+            except queue.Empty:
+                message = None
+            if message is not None:
+                self._handle(message)
+            self._forward_cancellations()
+            self._check_dead_workers()
+            self._fail_expired_jobs()
+            with self._lock:
+                if self._closed and not self._jobs and not any(w.process.is_alive() for w in self._workers):
+                    return
+
+    def _handle(self, message):
+        kind, key = message[0], message[1]
+        if kind == "ready":
+            with self._lock:
+                self._workers[key].metrics = message[2]
+                if all(w.metrics is not None for w in self._workers):
+                    self._ready.set()
+            print(f"✅ Worker {key} ready ({message[2]['status']})")
+            return
+
+        with self._lock:
+            job = self._jobs.get(key)
+        if job is None:
+            return
+        if kind == "progress":
+            if job.progress is not None:
+                try:
+                    job.progress(message[2], message[3], None)
+                except Exception as e:
+                    print(f"Progress callback failed: {e}")
+            return
+
+        if kind == "done":
+            result = _read_image(job.block, "RGB", message[2])
+            if message[3] is not None:
+                result.info["peak_rss_bytes"] = message[3]
+            if message[4]:
+                result.info["fallback"] = True
+            job.future.set_result(result)
+        elif kind == "cancelled":
+            from .model import RequestCancelled
+            job.future.set_exception(RequestCancelled("Request was cancelled"))
+        else:
+            job.future.set_exception(RuntimeError(message[2]))
+        self._finish(key, job, kind)
+
+    def _finish(self, job_id, job, kind):
+        job.block.close()
+        job.block.unlink()
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            job.worker.in_flight -= 1
+            job.worker.completed += 1
+            if kind == "done":
+                self._counters["requests"] += 1
+            elif kind == "cancelled":
+                self._counters["cancelled"] += 1
+            else:
+                self._counters["failed"] += 1
+
+    def _forward_cancellations(self):
+        with self._lock:
+            cancelled = [(job_id, job) for job_id, job in self._jobs.items()
+                         if not job.cancel_sent and job.cancel_event is not None and job.cancel_event.is_set()]
+            for _, job in cancelled:
+                job.cancel_sent = True
+        for job_id, job in cancelled:
+            job.worker.requests.put(("cancel", job_id))
+
+    def _check_dead_workers(self):
+        """Fail the jobs of workers that exited, and stop waiting for ones that died while loading"""
+        with self._lock:
+            lost = [(job_id, job) for job_id, job in self._jobs.items() if not job.worker.process.is_alive()]
+            # Otherwise the pool would report "loading" for good
+            died_loading = [w for w in self._workers if w.metrics is None and not w.process.is_alive()]
+            for worker in died_loading:
+                worker.metrics = {"status": "failed", "load_seconds": None, "model_tag": None}
+            if died_loading and all(w.metrics is not None for w in self._workers):
+                self._ready.set()
+            if not self._closed and not any(w.process.is_alive() for w in self._workers) \
+                    and not self._all_dead_reported:
+                self._all_dead_reported = True
+                print("❌ Every worker process exited; using the simple color fallback")
+        for worker in died_loading:
+            print(f"❌ Worker {worker.worker_id} exited before its model was ready "
+                  f"(exit code {worker.process.exitcode})")
+        for job_id, job in lost:
+            job.future.set_exception(RuntimeError(f"Worker {job.worker.worker_id} exited"))
+            self._finish(job_id, job, "failed")
+
+    def _fail_expired_jobs(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [(job_id, job) for job_id, job in self._jobs.items()
+                       if job.deadline is not None and now > job.deadline]
+        for job_id, job in expired:
+            # The worker may still be running it; a late response for a finished job is ignored
+            job.worker.requests.put(("cancel", job_id))
+            job.future.set_exception(TimeoutError(f"No response from worker {job.worker.worker_id} "
+                                                  f"after {self.job_timeout} s"))
+            self._finish(job_id, job, "failed")
+
+
+def _fallback_future(image, mask, prompt):
+    """A resolved Future holding the recolor fallback, marked like DressModifier.fallback_modify's results"""
+    from .fallback import recolor
+
+    future = Future()
+    result = recolor(image, mask, prompt)
+    result.info["fallback"] = True
+    future.set_result(result)
+    return future